@@ -0,0 +1,110 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FakeAPIConfig:
+    latency_ms: float = 30.0
+    jitter_ms: float = 10.0
+    retry_after_rate: float = 0.0
+    retry_after: int = 1
+    blocked_rate: float = 0.01
+    server_error_rate: float = 0.001
+    seed: int = 42
+
+
+class FakeTelegramAPI:
+    """Локальная замена Bot API для нагрузочных тестов
+
+    Отвечает на методы, которыми пользуется бот, с заданной задержкой и
+    с заданной долей ошибок 429 (RetryAfter), 403 (бот заблокирован) и 5xx.
+    """
+
+    def __init__(self, config: FakeAPIConfig = None):
+        self.config = config or FakeAPIConfig()
+        self.requests = Counter()
+        self._random = random.Random(self.config.seed)
+        self._runner = None
+        self._message_id = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081) -> str:
+        """Запуск сервера; возвращает базовый адрес для TelegramAPIServer.from_base"""
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def _message(self, chat_id: int, text: str = "") -> dict:
+        self._message_id += 1
+        return {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text or "ok",
+        }
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await request.post()
+        self.requests[method] += 1
+
+        config = self.config
+        await asyncio.sleep(max(0.0, config.latency_ms + self._random.uniform(-1, 1) * config.jitter_ms) / 1000)
+
+        roll = self._random.random()
+        if method.startswith(("send", "copy")):
+            if roll < config.retry_after_rate:
+                return self._error(429, f"Too Many Requests: retry after {config.retry_after}",
+                                   {"retry_after": config.retry_after})
+            roll -= config.retry_after_rate
+            if roll < config.blocked_rate:
+                return self._error(403, "Forbidden: bot was blocked by the user")
+            roll -= config.blocked_rate
+            if roll < config.server_error_rate:
+                return self._error(500, "Internal Server Error")
+
+        if method in ("sendMessage", "editMessageText", "sendDocument", "sendPhoto", "sendVideo",
+                      "sendAnimation", "sendAudio", "sendVoice"):
+            result = self._message(self._chat_id(params), params.get("text", ""))
+        elif method == "sendMediaGroup":
+            result = [self._message(self._chat_id(params))]
+        elif method == "copyMessage":
+            self._message_id += 1
+            result = {"message_id": self._message_id}
+        elif method == "getChat":
+            username = str(params.get("chat_id", "")).lstrip("@")
+            result = {"id": abs(hash(username)) % 10 ** 9, "type": "private",
+                      "username": username, "first_name": username}
+        elif method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        else:
+            result = True
+
+        return web.json_response({"ok": True, "result": result})
+
+    @staticmethod
+    def _chat_id(params) -> int:
+        """Числовой chat_id методов отправки; у getChat это может быть @username"""
+        return int(params.get("chat_id", 0) or 0)
+
+    @staticmethod
+    def _error(code: int, description: str, parameters: dict = None) -> web.Response:
+        body = {"ok": False, "error_code": code, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        return web.Response(status=code, text=json.dumps(body), content_type="application/json")
@@ -0,0 +1,183 @@
+"""Нагрузочные тесты бота на локальной замене Bot API
+
+Запуск: python -m benchmarks.run --sizes 1000 100000 1000000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+ADMIN_ID = 1
+
+# Настройки бота читаются при импорте, поэтому окружение задается до импорта модулей бота
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK")
+os.environ["ADMIN_ID"] = str(ADMIN_ID)
+os.environ["BROADCAST_WORKERS"] = "0"
+os.environ.setdefault("BROADCAST_RATE_LIMIT", "1000000")
+os.environ.setdefault("BROADCAST_CONCURRENCY", "100")
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.fsm.context import FSMContext  # noqa: E402
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+from aiogram.types import CallbackQuery  # noqa: E402
+
+from benchmarks.fake_api import FakeAPIConfig, FakeTelegramAPI  # noqa: E402
+from config.settings import settings  # noqa: E402
+from database.database import Database  # noqa: E402
+from handlers import admin  # noqa: E402
+from services.export import export_users  # noqa: E402
+
+
+class LatencyRecorder:
+    """Замер длительности запросов к Bot API по методам"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    async def __call__(self, make_request, bot, method):
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            self.samples[method.__api_method__].append(time.perf_counter() - started)
+
+
+def report(name: str, samples: List[float], items: int = 0, duration: float = 0.0):
+    """Строка отчета: количество, p50/p99 в миллисекундах и пропускная способность"""
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2] * 1000 if samples else 0.0
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000 if samples else 0.0
+    throughput = f"{items / duration:,.0f}/s" if items and duration else "-"
+    print(f"  {name:<32} n={len(samples):<8} p50={p50:9.2f} ms  p99={p99:9.2f} ms  {throughput:>12}")
+
+
+async def timed(coro_factory, repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await coro_factory()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def seed(db: Database, size: int):
+    """Заполнение базы пользователями пакетами"""
+    batch = 50000
+    for start in range(1, size + 1, batch):
+        await db.add_users([
+            (user_id, f"user{user_id}", f"User {user_id}")
+            for user_id in range(start, min(size, start + batch - 1) + 1)
+        ])
+    await db.save_message("Benchmark message")
+
+
+async def bench_size(size: int, bot: Bot, recorder: LatencyRecorder, directory: str, repeat: int):
+    print(f"\n{size:,} пользователей")
+    db = Database(
+        os.path.join(directory, f"bench_{size}.db"),
+        read_pool_size=settings.DB_READ_POOL_SIZE,
+        write_batch_size=settings.DB_WRITE_BATCH_SIZE,
+        write_interval=settings.DB_WRITE_INTERVAL_MS / 1000,
+        cache_ttl=settings.CACHE_TTL
+    )
+    await db.init_db()
+    admin.db = db
+
+    started = time.perf_counter()
+    await seed(db, size)
+    report("seed", [time.perf_counter() - started], size, time.perf_counter() - started)
+
+    samples = await timed(db.get_users, max(1, repeat // 10))
+    report("Database.get_users", samples, size * len(samples), sum(samples))
+
+    async def stream_ids():
+        async for _ in db.iter_users(ids_only=True):
+            pass
+    samples = await timed(stream_ids, max(1, repeat // 10))
+    report("Database.iter_users(ids_only)", samples, size * len(samples), sum(samples))
+
+    samples = await timed(db.get_stats, repeat)
+    report("Database.get_stats", samples, len(samples), sum(samples))
+
+    async def export_csv():
+        path, _, _ = await export_users(db, "csv")
+        os.remove(path)
+    samples = await timed(export_csv, max(1, repeat // 10))
+    report("export_users(csv)", samples, size * len(samples), sum(samples))
+
+    callback = CallbackQuery.model_validate({
+        "id": "1",
+        "chat_instance": "1",
+        "data": "confirm_broadcast",
+        "from": {"id": ADMIN_ID, "is_bot": False, "first_name": "Admin"},
+        "message": {
+            "message_id": 1,
+            "date": int(datetime.now().timestamp()),
+            "chat": {"id": ADMIN_ID, "type": "private"},
+            "text": "preview",
+        },
+    }, context={"bot": bot})
+    state = FSMContext(storage=MemoryStorage(), key=StorageKey(bot_id=bot.id, chat_id=ADMIN_ID, user_id=ADMIN_ID))
+
+    recorder.samples.clear()
+    started = time.perf_counter()
+    await admin.confirm_broadcast_handler(callback, state, bot)
+    # Обработчик отвечает сразу, сама рассылка идет в фоне
+    await asyncio.gather(*admin.background_tasks)
+    duration = time.perf_counter() - started
+    report("confirm_broadcast_handler", [duration], size, duration)
+    report("  sendMessage", recorder.samples["sendMessage"])
+
+    await db.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Нагрузочные тесты на локальной замене Bot API")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=50, help="повторов для быстрых операций")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=30.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--retry-after-rate", type=float, default=0.0)
+    parser.add_argument("--blocked-rate", type=float, default=0.01)
+    parser.add_argument("--server-error-rate", type=float, default=0.001)
+    parser.add_argument("--log-level", default="CRITICAL", help="журнал бота мешает отчету, по умолчанию скрыт")
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level))
+
+    api = FakeTelegramAPI(FakeAPIConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        retry_after_rate=args.retry_after_rate,
+        blocked_rate=args.blocked_rate,
+        server_error_rate=args.server_error_rate
+    ))
+    base = await api.start(port=args.port)
+
+    recorder = LatencyRecorder()
+    bot = Bot(token=settings.BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(base)))
+    bot.session.middleware(recorder)
+
+    print(f"Bot API: {base}, задержка {args.latency_ms}±{args.jitter_ms} мс, "
+          f"лимит рассылки {settings.BROADCAST_RATE_LIMIT:g}/s, параллельно {settings.BROADCAST_CONCURRENCY}")
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for size in args.sizes:
+                await bench_size(size, bot, recorder, directory, args.repeat)
+    finally:
+        await bot.session.close()
+        await api.stop()
+
+    print(f"\nЗапросов к Bot API: {dict(api.requests)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
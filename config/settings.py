@@ -7,6 +7,45 @@ class Settings:
     BOT_TOKEN: str = os.getenv("BOT_TOKEN")
     ADMIN_ID: int = int(os.getenv("ADMIN_ID", 0))
     DATABASE_URL: str = os.getenv("DATABASE_URL", "bot_database.db")
+    DB_READ_POOL_SIZE: int = int(os.getenv("DB_READ_POOL_SIZE", 2))
+    DB_WRITE_BATCH_SIZE: int = int(os.getenv("DB_WRITE_BATCH_SIZE", 500))
+    DB_WRITE_INTERVAL_MS: int = int(os.getenv("DB_WRITE_INTERVAL_MS", 250))
+    FSM_CACHE_SIZE: int = int(os.getenv("FSM_CACHE_SIZE", 10000))
+    CACHE_TTL: float = float(os.getenv("CACHE_TTL", 0))
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    THROTTLE_LIMIT: int = int(os.getenv("THROTTLE_LIMIT", 5))
+    THROTTLE_WINDOW: float = float(os.getenv("THROTTLE_WINDOW", 10))
+    THROTTLE_CACHE_SIZE: int = int(os.getenv("THROTTLE_CACHE_SIZE", 100000))
+    STATS_HISTORY_SIZE: int = int(os.getenv("STATS_HISTORY_SIZE", 10))
+    METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", 0))
+    BOT_MODE: str = os.getenv("BOT_MODE", "polling")
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")
+    WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
+    WEBHOOK_HOST: str = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", 8080))
+    WEBHOOK_QUEUE_SIZE: int = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+    WEBHOOK_WORKERS: int = int(os.getenv("WEBHOOK_WORKERS", 16))
+    WEBHOOK_DRAIN_TIMEOUT: float = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", 30))
+    USERS_PAGE_SIZE: int = int(os.getenv("USERS_PAGE_SIZE", 10))
+    RESOLVE_RATE_LIMIT: float = float(os.getenv("RESOLVE_RATE_LIMIT", 20))
+    RESOLVE_CACHE_SIZE: int = int(os.getenv("RESOLVE_CACHE_SIZE", 10000))
+    RESOLVE_CACHE_TTL: int = int(os.getenv("RESOLVE_CACHE_TTL", 7 * 24 * 3600))
+    RESOLVE_NEGATIVE_TTL: int = int(os.getenv("RESOLVE_NEGATIVE_TTL", 3600))
+    IMPORT_CONCURRENCY: int = int(os.getenv("IMPORT_CONCURRENCY", 10))
+    IMPORT_BATCH_SIZE: int = int(os.getenv("IMPORT_BATCH_SIZE", 500))
+    PROGRESS_INTERVAL: float = float(os.getenv("PROGRESS_INTERVAL", 3))
+    EXPORT_GZIP_THRESHOLD: int = int(os.getenv("EXPORT_GZIP_THRESHOLD", 10000))
+    BROADCAST_CONCURRENCY: int = int(os.getenv("BROADCAST_CONCURRENCY", 25))
+    BROADCAST_RATE_LIMIT: float = float(os.getenv("BROADCAST_RATE_LIMIT", 30))
+    BROADCAST_MAX_RETRIES: int = int(os.getenv("BROADCAST_MAX_RETRIES", 5))
+    BROADCAST_RETRY_BASE: float = float(os.getenv("BROADCAST_RETRY_BASE", 1))
+    BROADCAST_RETRY_MAX: float = float(os.getenv("BROADCAST_RETRY_MAX", 60))
+    SCHEDULER_INTERVAL: float = float(os.getenv("SCHEDULER_INTERVAL", 60))
+    BROADCAST_WORKERS: int = int(os.getenv("BROADCAST_WORKERS", 0))
+    BROADCAST_SHARDS: int = int(os.getenv("BROADCAST_SHARDS", 16))
+    WORKER_HEARTBEAT: int = int(os.getenv("WORKER_HEARTBEAT", 10))
+    WORKER_POLL_INTERVAL: float = float(os.getenv("WORKER_POLL_INTERVAL", 2))
 
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,68 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+MISSING = object()
+
+
+class CachedValue:
+    """Значение в памяти с необязательным временем жизни (ttl=0 - без истечения)
+
+    Каждое изменение увеличивает generation. Значение, прочитанное из базы, передается
+    в set вместе с поколением на начало чтения и не кэшируется, если за время чтения
+    была запись: иначе в кэш попал бы снимок до нее.
+    """
+
+    def __init__(self, ttl: float = 0):
+        self.ttl = ttl
+        self.generation = 0
+        self._value: Any = MISSING
+        self._expires = 0.0
+
+    def get(self) -> Any:
+        """Текущее значение или MISSING, если его нет или оно устарело"""
+        if self._value is not MISSING and self.ttl and time.monotonic() >= self._expires:
+            self._value = MISSING
+        return self._value
+
+    def set(self, value: Any, generation: Optional[int] = None):
+        """Запись значения; с generation - только если с начала чтения ничего не менялось"""
+        if generation is not None and generation != self.generation:
+            return
+        self.generation += 1
+        self._value = value
+        self._expires = time.monotonic() + self.ttl
+
+    def adjust(self, delta: int):
+        """Инкрементальное изменение счетчика, если он закэширован"""
+        self.generation += 1
+        if self.get() is not MISSING:
+            self._value += delta
+
+    def invalidate(self):
+        self.generation += 1
+        self._value = MISSING
+
+
+class LRUCache:
+    """Ограниченный по размеру кэш, вытесняющий давно не использованные записи"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max(1, max_size)
+        self._items: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        """Значение по ключу или MISSING"""
+        value = self._items.get(key, MISSING)
+        if value is not MISSING:
+            self._items.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._items.pop(key, None)
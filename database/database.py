@@ -1,139 +1,881 @@
+import asyncio
 import aiosqlite
+import json
 import logging
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import List, Optional
-from .models import User, Message
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
+from services.metrics import db_latency, instrument
+from .cache import MISSING, CachedValue
+from .migrations import migrate
+from .models import (
+    User, Message, BroadcastJob, BroadcastShard, BroadcastStats, ResolvedChat, ScheduledBroadcast, Tag
+)
+from .segments import compile_segment, is_empty_segment
+from .write_behind import Batches, WriteBehindBuffer
 
 logger = logging.getLogger(__name__)
 
+# Настройки соединений: WAL позволяет читателям не ждать писателя
+PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000",
+    "PRAGMA mmap_size = 134217728",
+    "PRAGMA busy_timeout = 5000",
+)
+CACHED_STATEMENTS = 256
 
+MAX_ID = 2 ** 63 - 1
+
+MESSAGE_COLUMNS = (
+    "id, text, created_date, is_active, content_type, entities, media, source_chat_id, source_message_id, "
+    "template_fields"
+)
+
+# Колонки users для переменных шаблона сообщения
+USER_TEMPLATE_COLUMNS = {"id": "id", "first_name": "first_name", "username": "username"}
+
+SCHEDULED_COLUMNS = "id, message_id, segment, run_at, spread_seconds, status, job_id"
+
+DEACTIVATE_USER_SQL = "UPDATE users SET is_active = 0 WHERE id = ? AND is_active = 1"
+
+
+@instrument(db_latency)
 class Database:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, read_pool_size: int = 2, write_batch_size: int = 500,
+                 write_interval: float = 0.25, cache_ttl: float = 0):
         self.db_path = db_path
+        self.read_pool_size = max(1, read_pool_size)
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._readers: Optional[asyncio.Queue] = None
+        self._write_lock = asyncio.Lock()
+        self._write_buffer = WriteBehindBuffer(self._write_batches, write_batch_size, write_interval)
+        # Кэш горячих данных админ-меню, обновляется при каждой записи
+        self._active_message = CachedValue(cache_ttl)
+        self._active_users = CachedValue(cache_ttl)
+
+    async def _connect(self, read_only: bool = False) -> aiosqlite.Connection:
+        """Открытие соединения с настроенными PRAGMA"""
+        conn = await aiosqlite.connect(self.db_path, cached_statements=CACHED_STATEMENTS)
+        pragmas = PRAGMAS + (("PRAGMA query_only = ON",) if read_only else ("PRAGMA journal_mode = WAL",))
+        for pragma in pragmas:
+            async with conn.execute(pragma):
+                pass
+        return conn
+
+    async def connect(self):
+        """Открытие постоянного соединения на запись и пула читателей"""
+        if self._writer is not None:
+            return
+
+        self._writer = await self._connect()
+
+        self._readers = asyncio.Queue()
+        for _ in range(self.read_pool_size):
+            self._readers.put_nowait(await self._connect(read_only=True))
+
+        self._write_buffer.start()
+
+    async def close(self):
+        """Закрытие всех соединений"""
+        if self._writer is None:
+            return
+
+        await self._write_buffer.close()
+        while not self._readers.empty():
+            await self._readers.get_nowait().close()
+        await self._writer.close()
+        self._writer = None
+        self._readers = None
+        logger.info("Соединения с базой данных закрыты")
+
+    @asynccontextmanager
+    async def _reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Соединение на чтение из пула"""
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def _write(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Эксклюзивный доступ к соединению на запись в рамках одной транзакции"""
+        async with self._write_lock:
+            try:
+                yield self._writer
+            except Exception:
+                await self._writer.rollback()
+                raise
+            await self._writer.commit()
+
+    async def _write_batches(self, batches: Batches):
+        """Запись накопленных операций одной транзакцией"""
+        deactivated = 0
+        async with self._write() as db:
+            for sql, params in batches.items():
+                cursor = await db.executemany(sql, params)
+                if sql == DEACTIVATE_USER_SQL:
+                    deactivated = cursor.rowcount
+        self._active_users.adjust(-deactivated)
+
+    async def flush_writes(self):
+        """Принудительная запись отложенных операций"""
+        await self._write_buffer.flush()
 
     async def init_db(self):
-        """Инициализация базы данных и создание таблиц"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Создание таблицы пользователей
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT NOT NULL,
-                    added_date TEXT NOT NULL,
-                    is_active INTEGER DEFAULT 1
-                )
-            """)
-
-            # Создание таблицы сообщений
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    text TEXT NOT NULL,
-                    created_date TEXT NOT NULL,
-                    is_active INTEGER DEFAULT 1
-                )
-            """)
+        """Инициализация базы данных и миграция схемы"""
+        await self.connect()
+        async with self._write_lock:
+            await migrate(self._writer)
 
-            await db.commit()
-            logger.info("База данных инициализирована")
+        logger.info("База данных инициализирована")
 
     async def add_user(self, user_id: int, username: Optional[str], first_name: str) -> bool:
         """Добавление пользователя"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self._write() as db:
+                async with db.execute("SELECT is_active FROM users WHERE id = ?", (user_id,)) as cursor:
+                    row = await cursor.fetchone()
+                    activated = 0 if row and row[0] else 1
+
+                # username уникален: освобождаем его, если он перешел к другому аккаунту
+                if username:
+                    await db.execute(
+                        "UPDATE users SET username = NULL WHERE username = ? AND id != ?",
+                        (username, user_id)
+                    )
                 await db.execute(
-                    "INSERT OR REPLACE INTO users (id, username, first_name, added_date, is_active) VALUES (?, ?, ?, ?, ?)",
-                    (user_id, username, first_name, datetime.now().isoformat(), 1)
+                    "INSERT INTO users (id, username, first_name, added_date, is_active) VALUES (?, ?, ?, ?, 1) "
+                    "ON CONFLICT (id) DO UPDATE SET "
+                    "username = excluded.username, first_name = excluded.first_name, is_active = 1",
+                    (user_id, username, first_name, int(time.time()))
                 )
-                await db.commit()
-                logger.info(f"Пользователь {user_id} добавлен")
-                return True
+            self._active_users.adjust(activated)
+            logger.info(f"Пользователь {user_id} добавлен")
+            return True
         except Exception as e:
             logger.error(f"Ошибка добавления пользователя: {e}")
             return False
 
+    async def add_users(self, users: List[Tuple[int, Optional[str], Optional[str]]]) -> int:
+        """Пакетное добавление пользователей (id, username, first_name) одной транзакцией
+
+        None в username или first_name - значение неизвестно: у существующего пользователя
+        сохраняется прежнее, новому вместо имени записывается id.
+        """
+        now = int(time.time())
+        async with self._write() as db:
+            await db.executemany(
+                "UPDATE users SET username = NULL WHERE username = ? AND id != ?",
+                [(username, user_id) for user_id, username, _ in users if username]
+            )
+            await db.executemany(
+                "INSERT INTO users (id, username, first_name, added_date, is_active) "
+                "VALUES (?, ?, COALESCE(?, ?), ?, 1) "
+                "ON CONFLICT (id) DO UPDATE SET "
+                "username = COALESCE(excluded.username, users.username), "
+                "first_name = COALESCE(?, users.first_name), is_active = 1",
+                [
+                    (user_id, username, first_name, str(user_id), now, first_name)
+                    for user_id, username, first_name in users
+                ]
+            )
+        # Сколько из них были неактивны, неизвестно - счетчик пересчитается при следующем чтении
+        self._active_users.invalidate()
+        logger.info(f"Добавлено пакетом {len(users)} пользователей")
+        return len(users)
+
+    @staticmethod
+    def _user_from_row(row) -> User:
+        return User(
+            id=row[0],
+            username=row[1],
+            first_name=row[2],
+            added_date=datetime.fromtimestamp(row[3]),
+            is_active=bool(row[4])
+        )
+
+    async def iter_users(self, batch_size: int = 500, after_id: int = 0, active_only: bool = True,
+                         ids_only: bool = False) -> AsyncIterator[Union[User, int]]:
+        """Потоковое чтение пользователей в порядке id (keyset-пагинация)"""
+        columns = "id" if ids_only else "id, username, first_name, added_date, is_active"
+        query = f"SELECT {columns} FROM users WHERE id > ?"
+        if active_only:
+            query += " AND is_active = 1"
+        query += " ORDER BY id LIMIT ?"
+
+        while True:
+            # Соединение берется на одну страницу, чтобы не занимать пул на всю выборку
+            async with self._reader() as db:
+                async with db.execute(query, (after_id, batch_size)) as cursor:
+                    rows = await cursor.fetchall()
+
+            for row in rows:
+                yield row[0] if ids_only else self._user_from_row(row)
+
+            if len(rows) < batch_size:
+                return
+            after_id = rows[-1][0]
+
+    async def get_user(self, user_id: int) -> Optional[User]:
+        """Получение пользователя по id"""
+        async with self._reader() as db:
+            async with db.execute(
+                    "SELECT id, username, first_name, added_date, is_active FROM users WHERE id = ?",
+                    (user_id,)) as cursor:
+                row = await cursor.fetchone()
+                return self._user_from_row(row) if row else None
+
+    async def get_users_page(self, after_id: int = 0, before_id: Optional[int] = None,
+                             limit: int = 10) -> Tuple[List[User], bool, bool]:
+        """Страница активных пользователей по курсору: (пользователи, есть_предыдущая, есть_следующая)"""
+        columns = "id, username, first_name, added_date, is_active"
+        async with self._reader() as db:
+            if before_id is not None:
+                async with db.execute(
+                        f"SELECT {columns} FROM users WHERE is_active = 1 AND id < ? ORDER BY id DESC LIMIT ?",
+                        (before_id, limit + 1)) as cursor:
+                    rows = await cursor.fetchall()
+                has_prev = len(rows) > limit
+                rows = rows[:limit][::-1]
+                has_next = False
+                if rows:
+                    async with db.execute(
+                            "SELECT EXISTS (SELECT 1 FROM users WHERE is_active = 1 AND id > ?)",
+                            (rows[-1][0],)) as cursor:
+                        has_next = bool((await cursor.fetchone())[0])
+            else:
+                async with db.execute(
+                        f"SELECT {columns} FROM users WHERE is_active = 1 AND id > ? ORDER BY id LIMIT ?",
+                        (after_id, limit + 1)) as cursor:
+                    rows = await cursor.fetchall()
+                has_next = len(rows) > limit
+                rows = rows[:limit]
+                has_prev = False
+                if rows:
+                    async with db.execute(
+                            "SELECT EXISTS (SELECT 1 FROM users WHERE is_active = 1 AND id < ?)",
+                            (rows[0][0],)) as cursor:
+                        has_prev = bool((await cursor.fetchone())[0])
+
+        if not rows and before_id is not None:
+            # Все предыдущие пользователи удалены - показываем первую страницу
+            return await self.get_users_page(limit=limit)
+        if not rows and after_id:
+            # Удалены последние пользователи страницы - показываем предыдущую
+            return await self.get_users_page(before_id=after_id + 1, limit=limit)
+
+        return [self._user_from_row(row) for row in rows], has_prev, has_next
+
     async def get_users(self, active_only: bool = True) -> List[User]:
         """Получение списка пользователей"""
-        async with aiosqlite.connect(self.db_path) as db:
-            query = "SELECT * FROM users"
-            if active_only:
-                query += " WHERE is_active = 1"
+        return [user async for user in self.iter_users(active_only=active_only)]
 
+    async def count_users(self, active_only: bool = True) -> int:
+        """Количество пользователей"""
+        if active_only:
+            cached = self._active_users.get()
+            if cached is not MISSING:
+                return cached
+
+        query = "SELECT COUNT(*) FROM users"
+        if active_only:
+            query += " WHERE is_active = 1"
+        generation = self._active_users.generation
+
+        async with self._reader() as db:
             async with db.execute(query) as cursor:
-                rows = await cursor.fetchall()
-                return [
-                    User(
-                        id=row[0],
-                        username=row[1],
-                        first_name=row[2],
-                        added_date=datetime.fromisoformat(row[3]),
-                        is_active=bool(row[4])
+                count = (await cursor.fetchone())[0]
+
+        if active_only:
+            self._active_users.set(count, generation)
+        return count
+
+    async def count_segment(self, segment: Optional[dict]) -> int:
+        """Количество активных пользователей сегмента"""
+        if is_empty_segment(segment):
+            return await self.count_users()
+
+        query, params = compile_segment(segment)
+        async with self._reader() as db:
+            async with db.execute(f"SELECT COUNT(*) FROM ({query})", params) as cursor:
+                return (await cursor.fetchone())[0]
+
+    async def get_tags(self) -> List[Tag]:
+        """Все теги с количеством активных пользователей"""
+        async with self._reader() as db:
+            async with db.execute(
+                    "SELECT t.id, t.name, COUNT(u.id) FROM tags t "
+                    "LEFT JOIN user_tags ut ON ut.tag_id = t.id "
+                    "LEFT JOIN users u ON u.id = ut.user_id AND u.is_active = 1 "
+                    "GROUP BY t.id ORDER BY t.name") as cursor:
+                return [Tag(id=row[0], name=row[1], users=row[2]) for row in await cursor.fetchall()]
+
+    async def tag_users(self, name: str, user_ids: List[int], usernames: List[str]) -> int:
+        """Назначение тега пользователям по id и username (тег создается при необходимости)"""
+        async with self._write() as db:
+            await db.execute("INSERT INTO tags (name) VALUES (?) ON CONFLICT (name) DO NOTHING", (name,))
+            async with db.execute("SELECT id FROM tags WHERE name = ?", (name,)) as cursor:
+                tag_id = (await cursor.fetchone())[0]
+
+            tagged = 0
+            for column, values in (("id", user_ids), ("username", usernames)):
+                # Пакетами, чтобы не упереться в лимит параметров SQLite
+                for i in range(0, len(values), 500):
+                    chunk = values[i:i + 500]
+                    cursor = await db.execute(
+                        f"INSERT OR IGNORE INTO user_tags (tag_id, user_id) "
+                        f"SELECT ?, id FROM users WHERE {column} IN ({', '.join('?' * len(chunk))})",
+                        (tag_id, *chunk)
                     )
-                    for row in rows
-                ]
+                    tagged += cursor.rowcount
+        return tagged
+
+    async def delete_tag(self, tag_id: int):
+        """Удаление тега вместе с его назначениями"""
+        async with self._write() as db:
+            await db.execute("DELETE FROM user_tags WHERE tag_id = ?", (tag_id,))
+            await db.execute("DELETE FROM tags WHERE id = ?", (tag_id,))
 
     async def delete_user(self, user_id: int) -> bool:
         """Мягкое удаление пользователя"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute(
-                    "UPDATE users SET is_active = 0 WHERE id = ?",
-                    (user_id,)
-                )
-                await db.commit()
-                logger.info(f"Пользователь {user_id} деактивирован")
-                return True
+            async with self._write() as db:
+                cursor = await db.execute(DEACTIVATE_USER_SQL, (user_id,))
+                deactivated = cursor.rowcount
+            self._active_users.adjust(-deactivated)
+            logger.info(f"Пользователь {user_id} деактивирован")
+            return True
         except Exception as e:
             logger.error(f"Ошибка удаления пользователя: {e}")
             return False
 
-    async def save_message(self, text: str) -> bool:
+    async def defer_delete_user(self, user_id: int):
+        """Отложенное мягкое удаление (для пакетной деактивации во время рассылки)"""
+        await self._write_buffer.add(DEACTIVATE_USER_SQL, (user_id,))
+
+    async def get_resolved_chat(self, username: str) -> Optional[ResolvedChat]:
+        """Сохраненный результат поиска по username"""
+        async with self._reader() as db:
+            async with db.execute(
+                    "SELECT username, chat_id, first_name, resolved_at FROM resolved_chats WHERE username = ?",
+                    (username,)) as cursor:
+                row = await cursor.fetchone()
+                if row:
+                    return ResolvedChat(
+                        username=row[0],
+                        chat_id=row[1],
+                        first_name=row[2],
+                        resolved_at=datetime.fromtimestamp(row[3])
+                    )
+                return None
+
+    async def defer_resolved_chat(self, chat: ResolvedChat):
+        """Отложенное сохранение результата поиска по username"""
+        await self._write_buffer.add(
+            "INSERT INTO resolved_chats (username, chat_id, first_name, resolved_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (username) DO UPDATE SET "
+            "chat_id = excluded.chat_id, first_name = excluded.first_name, resolved_at = excluded.resolved_at",
+            (chat.username, chat.chat_id, chat.first_name, int(chat.resolved_at.timestamp()))
+        )
+
+    async def get_fsm_record(self, key: str) -> Optional[Tuple[Optional[str], dict]]:
+        """Сохраненные состояние и данные FSM"""
+        async with self._reader() as db:
+            async with db.execute("SELECT state, data FROM fsm_storage WHERE key = ?", (key,)) as cursor:
+                row = await cursor.fetchone()
+                return (row[0], json.loads(row[1])) if row else None
+
+    async def defer_fsm_record(self, key: str, state: Optional[str], data: dict):
+        """Отложенное сохранение состояния и данных FSM"""
+        await self._write_buffer.add(
+            "INSERT INTO fsm_storage (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET "
+            "state = excluded.state, data = excluded.data, updated_at = excluded.updated_at",
+            (key, state, json.dumps(data, ensure_ascii=False), int(time.time()))
+        )
+
+    async def save_message(self, text: str, content_type: str = "text", entities: Optional[List[dict]] = None,
+                           media: Optional[List[dict]] = None, source_chat_id: Optional[int] = None,
+                           source_message_id: Optional[int] = None,
+                           template_fields: Optional[List[str]] = None) -> bool:
         """Сохранение сообщения для рассылки"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self._write() as db:
                 # Деактивируем все предыдущие сообщения
                 await db.execute("UPDATE messages SET is_active = 0")
 
                 # Добавляем новое активное сообщение
-                await db.execute(
-                    "INSERT INTO messages (text, created_date, is_active) VALUES (?, ?, ?)",
-                    (text, datetime.now().isoformat(), 1)
+                created_date = int(time.time())
+                cursor = await db.execute(
+                    "INSERT INTO messages (text, created_date, is_active, content_type, entities, media, "
+                    "source_chat_id, source_message_id, template_fields) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (text, created_date, 1, content_type,
+                     json.dumps(entities, ensure_ascii=False) if entities else None,
+                     json.dumps(media, ensure_ascii=False) if media else None,
+                     source_chat_id, source_message_id,
+                     json.dumps(template_fields) if template_fields is not None else None)
                 )
-                await db.commit()
-                logger.info("Сообщение сохранено")
-                return True
+            self._active_message.set(Message(
+                id=cursor.lastrowid,
+                text=text,
+                created_date=datetime.fromtimestamp(created_date),
+                content_type=content_type,
+                entities=entities or [],
+                media=media or [],
+                source_chat_id=source_chat_id,
+                source_message_id=source_message_id,
+                template_fields=template_fields
+            ))
+            logger.info("Сообщение сохранено")
+            return True
         except Exception as e:
             logger.error(f"Ошибка сохранения сообщения: {e}")
             return False
 
+    @staticmethod
+    def _message_from_row(row) -> Message:
+        return Message(
+            id=row[0],
+            text=row[1],
+            created_date=datetime.fromtimestamp(row[2]),
+            is_active=bool(row[3]),
+            content_type=row[4],
+            entities=json.loads(row[5]) if row[5] else [],
+            media=json.loads(row[6]) if row[6] else [],
+            source_chat_id=row[7],
+            source_message_id=row[8],
+            template_fields=json.loads(row[9]) if row[9] is not None else None
+        )
+
     async def get_active_message(self) -> Optional[Message]:
         """Получение активного сообщения"""
-        async with aiosqlite.connect(self.db_path) as db:
+        cached = self._active_message.get()
+        if cached is not MISSING:
+            return cached
+
+        generation = self._active_message.generation
+        async with self._reader() as db:
             async with db.execute(
-                    "SELECT * FROM messages WHERE is_active = 1 ORDER BY created_date DESC LIMIT 1") as cursor:
+                    f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE is_active = 1 "
+                    "ORDER BY created_date DESC LIMIT 1") as cursor:
                 row = await cursor.fetchone()
-                if row:
-                    return Message(
-                        id=row[0],
-                        text=row[1],
-                        created_date=datetime.fromisoformat(row[2]),
-                        is_active=bool(row[3])
-                    )
-                return None
+
+        message = self._message_from_row(row) if row else None
+        self._active_message.set(message, generation)
+        return message
+
+    async def get_message(self, message_id: int) -> Optional[Message]:
+        """Получение сообщения по id"""
+        async with self._reader() as db:
+            async with db.execute(f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE id = ?", (message_id,)) as cursor:
+                row = await cursor.fetchone()
+                return self._message_from_row(row) if row else None
+
+    @staticmethod
+    def _job_from_row(row) -> BroadcastJob:
+        return BroadcastJob(
+            id=row[0],
+            message_id=row[1],
+            status=row[2],
+            total=row[3],
+            created_date=datetime.fromtimestamp(row[4]),
+            finished_date=datetime.fromtimestamp(row[5]) if row[5] else None
+        )
+
+    async def create_broadcast_job(self, message_id: int, shards: int = 0, segment: Optional[dict] = None,
+                                   scheduled_id: Optional[int] = None) -> BroadcastJob:
+        """Создание задания рассылки со снимком списка получателей
+
+        Получатели - активные пользователи сегмента (без сегмента - все активные).
+        При shards > 0 получатели делятся на диапазоны id для процессов-воркеров,
+        а задание ставится в очередь вместо отправки в текущем процессе.
+        scheduled_id связывает задание с запланированной рассылкой в той же транзакции.
+        """
+        created_date = int(time.time())
+        status = "queued" if shards > 0 else "running"
+        async with self._write() as db:
+            cursor = await db.execute(
+                "INSERT INTO broadcast_jobs (message_id, status, created_date) VALUES (?, ?, ?)",
+                (message_id, status, created_date)
+            )
+            job_id = cursor.lastrowid
+            recipients, params = compile_segment(segment, before_job_id=job_id)
+            cursor = await db.execute(
+                f"INSERT INTO broadcast_deliveries (job_id, user_id, status) "
+                f"SELECT ?, id, 'pending' FROM ({recipients})",
+                (job_id, *params)
+            )
+            total = cursor.rowcount
+            await db.execute("UPDATE broadcast_jobs SET total = ? WHERE id = ?", (total, job_id))
+            if scheduled_id is not None:
+                await db.execute("UPDATE scheduled_broadcasts SET job_id = ? WHERE id = ?", (job_id, scheduled_id))
+
+            if shards > 0:
+                await db.execute(
+                    "INSERT INTO broadcast_shards (job_id, shard, start_id, end_id) "
+                    "SELECT ?, shard, MIN(user_id), MAX(user_id) FROM ("
+                    "    SELECT user_id, NTILE(?) OVER (ORDER BY user_id) AS shard "
+                    "    FROM broadcast_deliveries WHERE job_id = ?"
+                    ") GROUP BY shard",
+                    (job_id, shards, job_id)
+                )
+                if not total:
+                    # Нечего делить между воркерами - задание сразу завершено
+                    status = "done"
+                    await db.execute("UPDATE broadcast_jobs SET status = 'done' WHERE id = ?", (job_id,))
+
+        logger.info(f"Создано задание рассылки {job_id} на {total} получателей")
+        return BroadcastJob(id=job_id, message_id=message_id, status=status, total=total,
+                            created_date=datetime.fromtimestamp(created_date))
+
+    async def get_job(self, job_id: int) -> Optional[BroadcastJob]:
+        """Получение задания рассылки по id"""
+        async with self._reader() as db:
+            async with db.execute(
+                    "SELECT id, message_id, status, total, created_date, finished_date "
+                    "FROM broadcast_jobs WHERE id = ?", (job_id,)) as cursor:
+                row = await cursor.fetchone()
+                return self._job_from_row(row) if row else None
+
+    async def get_unfinished_jobs(self) -> List[BroadcastJob]:
+        """Задания рассылки текущего процесса, прерванные до завершения
+
+        Задания идущих запланированных рассылок продолжает планировщик со своим темпом;
+        повторная отправка по уже завершенной запланированной рассылке продолжается здесь.
+        """
+        async with self._reader() as db:
+            async with db.execute(
+                    "SELECT id, message_id, status, total, created_date, finished_date "
+                    "FROM broadcast_jobs WHERE status = 'running' "
+                    "AND id NOT IN ("
+                    "    SELECT job_id FROM scheduled_broadcasts WHERE job_id IS NOT NULL AND status = 'running'"
+                    ") "
+                    "ORDER BY id") as cursor:
+                return [self._job_from_row(row) for row in await cursor.fetchall()]
+
+    async def claim_shard(self, worker: str, stale_after: int) -> Optional[BroadcastShard]:
+        """Захват свободного диапазона воркером (или брошенного упавшим воркером)"""
+        now = int(time.time())
+        async with self._write() as db:
+            async with db.execute(
+                    "UPDATE broadcast_shards SET status = 'running', worker = ?, heartbeat = ? "
+                    "WHERE rowid = ("
+                    "    SELECT rowid FROM broadcast_shards "
+                    "    WHERE status = 'pending' OR (status = 'running' AND heartbeat < ?) "
+                    "    ORDER BY job_id, shard LIMIT 1"
+                    ") RETURNING job_id, shard, start_id, end_id",
+                    (worker, now, now - stale_after)) as cursor:
+                row = await cursor.fetchone()
+
+        return BroadcastShard(*row) if row else None
+
+    async def heartbeat_shard(self, shard: BroadcastShard, worker: str) -> bool:
+        """Продление захвата диапазона; False, если его уже забрал другой воркер"""
+        async with self._write() as db:
+            cursor = await db.execute(
+                "UPDATE broadcast_shards SET heartbeat = ? WHERE job_id = ? AND shard = ? AND worker = ?",
+                (int(time.time()), shard.job_id, shard.shard, worker)
+            )
+            return cursor.rowcount > 0
+
+    async def finish_shard(self, shard: BroadcastShard) -> bool:
+        """Завершение диапазона; True, если это был последний диапазон задания"""
+        async with self._write() as db:
+            await db.execute(
+                "UPDATE broadcast_shards SET status = 'done' WHERE job_id = ? AND shard = ?",
+                (shard.job_id, shard.shard)
+            )
+            cursor = await db.execute(
+                "UPDATE broadcast_jobs SET status = 'done', finished_date = ? "
+                "WHERE id = ? AND status = 'queued' AND NOT EXISTS ("
+                "    SELECT 1 FROM broadcast_shards WHERE job_id = ? AND status != 'done'"
+                ")",
+                (int(time.time()), shard.job_id, shard.job_id)
+            )
+            return cursor.rowcount > 0
+
+    async def iter_pending_deliveries(self, job_id: int, batch_size: int = 500, after_id: int = 0,
+                                      until_id: int = MAX_ID,
+                                      fields: Sequence[str] = ()) -> AsyncIterator[Union[int, tuple]]:
+        """Потоковое чтение получателей задания, которым сообщение еще не отправлялось
+
+        Без fields выдаются id, с fields - кортежи (id, значения колонок пользователя)
+        из того же запроса, что и получатели.
+        """
+        columns = "".join(f", u.{USER_TEMPLATE_COLUMNS[field]}" for field in fields)
+        query = (
+            f"SELECT d.user_id{columns} FROM broadcast_deliveries d "
+            + ("JOIN users u ON u.id = d.user_id " if fields else "")
+            + "WHERE d.job_id = ? AND d.status = 'pending' AND d.user_id > ? AND d.user_id <= ? "
+            "ORDER BY d.user_id LIMIT ?"
+        )
+
+        while True:
+            async with self._reader() as db:
+                async with db.execute(query, (job_id, after_id, until_id, batch_size)) as cursor:
+                    rows = await cursor.fetchall()
+
+            for row in rows:
+                yield tuple(row) if fields else row[0]
+
+            if len(rows) < batch_size:
+                return
+            after_id = rows[-1][0]
+
+    async def iter_requeued_deliveries(self, job_id: int, user_ids: Sequence[int], batch_size: int = 500,
+                                       fields: Sequence[str] = ()) -> AsyncIterator[Union[int, tuple]]:
+        """Потоковое чтение получателей задания из списка user_ids, которым сообщение еще не отправлялось
+
+        Формат как у iter_pending_deliveries; получатели читаются пачками по списку id,
+        а не по диапазону, чтобы не задеть остальные ожидающие доставки задания.
+        """
+        columns = "".join(f", u.{USER_TEMPLATE_COLUMNS[field]}" for field in fields)
+        user_ids = sorted(user_ids)
+        for i in range(0, len(user_ids), batch_size):
+            batch = user_ids[i:i + batch_size]
+            query = (
+                f"SELECT d.user_id{columns} FROM broadcast_deliveries d "
+                + ("JOIN users u ON u.id = d.user_id " if fields else "")
+                + f"WHERE d.job_id = ? AND d.status = 'pending' AND d.user_id IN ({', '.join('?' * len(batch))}) "
+                "ORDER BY d.user_id"
+            )
+            async with self._reader() as db:
+                async with db.execute(query, (job_id, *batch)) as cursor:
+                    rows = await cursor.fetchall()
+
+            for row in rows:
+                yield tuple(row) if fields else row[0]
+
+    async def defer_delivery(self, job_id: int, user_id: int, status: str):
+        """Отложенная фиксация результата доставки"""
+        await self._write_buffer.add(
+            "UPDATE broadcast_deliveries SET status = ? WHERE job_id = ? AND user_id = ?",
+            (status, job_id, user_id)
+        )
+
+    async def defer_dead_letter(self, job_id: int, user_id: int, error: str):
+        """Отложенное сохранение окончательно недоставленного сообщения"""
+        await self._write_buffer.add(
+            "INSERT INTO dead_letters (job_id, user_id, error, created_date) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(job_id, user_id) DO UPDATE SET error = excluded.error, created_date = excluded.created_date",
+            (job_id, user_id, error, int(time.time()))
+        )
+
+    async def get_dead_letter_jobs(self, limit: int = 10) -> List[Tuple[int, int]]:
+        """Последние завершенные задания с недоставленными сообщениями: (id задания, количество)
+
+        Идущие задания не показываются: их недоставленные сообщения еще пополняются.
+        """
+        async with self._reader() as db:
+            async with db.execute(
+                    "SELECT d.job_id, COUNT(*) FROM dead_letters d JOIN broadcast_jobs j ON j.id = d.job_id "
+                    "WHERE j.status IN ('done', 'cancelled') "
+                    "GROUP BY d.job_id ORDER BY d.job_id DESC LIMIT ?",
+                    (limit,)) as cursor:
+                return [tuple(row) for row in await cursor.fetchall()]
+
+    async def requeue_dead_letters(self, job_id: int) -> List[int]:
+        """Возврат недоставленных сообщений завершенного задания в очередь отправки
+
+        Возвращает id получателей, которым нужно отправить повторно; для идущего задания - пустой список.
+        Получатели, ставшие неактивными, пропускаются. Завершенное задание снова становится
+        незавершенным, поэтому при перезапуске бота повторная отправка продолжится. Остановленное
+        задание остается остановленным: его ожидающие доставки - это получатели, до которых
+        рассылка не дошла, и при перезапуске им ничего не отправляется.
+        """
+        async with self._write() as db:
+            async with db.execute("SELECT status FROM broadcast_jobs WHERE id = ?", (job_id,)) as cursor:
+                row = await cursor.fetchone()
+            if row is None or row[0] not in ("done", "cancelled"):
+                return []
+
+            async with db.execute(
+                    "UPDATE broadcast_deliveries SET status = 'pending' "
+                    "WHERE job_id = ? AND user_id IN ("
+                    "    SELECT d.user_id FROM dead_letters d JOIN users u ON u.id = d.user_id "
+                    "    WHERE d.job_id = ? AND u.is_active = 1"
+                    ") RETURNING user_id",
+                    (job_id, job_id)) as cursor:
+                requeued = [user_id for user_id, in await cursor.fetchall()]
+            await db.execute("DELETE FROM dead_letters WHERE job_id = ?", (job_id,))
+            if requeued and row[0] == "done":
+                await db.execute(
+                    "UPDATE broadcast_jobs SET status = 'running', finished_date = NULL WHERE id = ?",
+                    (job_id,)
+                )
+        return requeued
+
+    async def finish_broadcast_job(self, job_id: int, status: str = "done"):
+        """Завершение задания рассылки"""
+        async with self._write() as db:
+            await db.execute(
+                "UPDATE broadcast_jobs SET status = ?, finished_date = ? WHERE id = ?",
+                (status, int(time.time()), job_id)
+            )
+
+    async def cancel_broadcast_job(self, job_id: int):
+        """Отмена еще не начатого задания, в том числе переданного воркерам"""
+        async with self._write() as db:
+            await db.execute(
+                "UPDATE broadcast_jobs SET status = 'cancelled', finished_date = ? WHERE id = ?",
+                (int(time.time()), job_id)
+            )
+            # Свободные диапазоны воркеры больше не захватят
+            await db.execute(
+                "UPDATE broadcast_shards SET status = 'done' WHERE job_id = ? AND status = 'pending'", (job_id,)
+            )
+
+    async def get_job_counts(self, job_id: int) -> Dict[str, int]:
+        """Количество доставок задания по статусам"""
+        async with self._reader() as db:
+            async with db.execute(
+                    "SELECT status, COUNT(*) FROM broadcast_deliveries WHERE job_id = ? GROUP BY status",
+                    (job_id,)) as cursor:
+                return {status: count for status, count in await cursor.fetchall()}
+
+    @staticmethod
+    def _scheduled_from_row(row) -> ScheduledBroadcast:
+        return ScheduledBroadcast(
+            id=row[0],
+            message_id=row[1],
+            segment=json.loads(row[2]) if row[2] else None,
+            run_at=datetime.fromtimestamp(row[3]),
+            spread_seconds=row[4],
+            status=row[5],
+            job_id=row[6]
+        )
+
+    async def create_scheduled_broadcast(self, message_id: int, run_at: datetime, spread_seconds: int = 0,
+                                         segment: Optional[dict] = None) -> int:
+        """Планирование рассылки на время run_at, растянутой на spread_seconds"""
+        async with self._write() as db:
+            cursor = await db.execute(
+                "INSERT INTO scheduled_broadcasts (message_id, segment, run_at, spread_seconds, created_date) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (message_id, json.dumps(segment) if segment else None, int(run_at.timestamp()),
+                 spread_seconds, int(time.time()))
+            )
+            return cursor.lastrowid
+
+    async def get_scheduled_broadcasts(self) -> List[ScheduledBroadcast]:
+        """Ожидающие и идущие запланированные рассылки"""
+        async with self._reader() as db:
+            async with db.execute(
+                    f"SELECT {SCHEDULED_COLUMNS} FROM scheduled_broadcasts "
+                    "WHERE status IN ('scheduled', 'running') ORDER BY run_at") as cursor:
+                return [self._scheduled_from_row(row) for row in await cursor.fetchall()]
+
+    async def claim_due_broadcasts(self) -> List[ScheduledBroadcast]:
+        """Перевод наступивших запланированных рассылок в работу"""
+        async with self._write() as db:
+            async with db.execute(
+                    f"UPDATE scheduled_broadcasts SET status = 'running' "
+                    f"WHERE status = 'scheduled' AND run_at <= ? RETURNING {SCHEDULED_COLUMNS}",
+                    (int(time.time()),)) as cursor:
+                return [self._scheduled_from_row(row) for row in await cursor.fetchall()]
+
+    async def get_running_scheduled(self) -> List[ScheduledBroadcast]:
+        """Запланированные рассылки, прерванные перезапуском"""
+        async with self._reader() as db:
+            async with db.execute(
+                    f"SELECT {SCHEDULED_COLUMNS} FROM scheduled_broadcasts WHERE status = 'running'") as cursor:
+                return [self._scheduled_from_row(row) for row in await cursor.fetchall()]
+
+    async def get_next_run_at(self) -> Optional[datetime]:
+        """Время ближайшей ожидающей рассылки"""
+        async with self._reader() as db:
+            async with db.execute(
+                    "SELECT MIN(run_at) FROM scheduled_broadcasts WHERE status = 'scheduled'") as cursor:
+                run_at = (await cursor.fetchone())[0]
+                return datetime.fromtimestamp(run_at) if run_at else None
+
+    async def get_scheduled_status(self, scheduled_id: int) -> Optional[str]:
+        """Текущий статус запланированной рассылки"""
+        async with self._reader() as db:
+            async with db.execute("SELECT status FROM scheduled_broadcasts WHERE id = ?", (scheduled_id,)) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else None
+
+    async def finish_scheduled(self, scheduled_id: int, status: str = "done") -> bool:
+        """Завершение или отмена запланированной рассылки; False, если она уже завершена"""
+        async with self._write() as db:
+            cursor = await db.execute(
+                "UPDATE scheduled_broadcasts SET status = ? WHERE id = ? AND status IN ('scheduled', 'running')",
+                (status, scheduled_id)
+            )
+            return cursor.rowcount > 0
+
+    async def defer_minute_stats(self, job_id: int, minute: int, sent: int, blocked: int, failed: int):
+        """Отложенное добавление итогов минуты рассылки (воркеры пишут в одну строку)"""
+        await self._write_buffer.add(
+            "INSERT INTO broadcast_minutes (job_id, minute, sent, blocked, failed) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (job_id, minute) DO UPDATE SET sent = sent + excluded.sent, "
+            "blocked = blocked + excluded.blocked, failed = failed + excluded.failed",
+            (job_id, minute, sent, blocked, failed)
+        )
+
+    async def record_broadcast_run(self, job_id: int, sent: int, blocked: int, failed: int, duration: float,
+                                   requeued: int = 0):
+        """Добавление итогов одного запуска отправки к сводке задания
+
+        Пик - лучшая минута рассылки; запуск короче минуты считается по своей средней скорости.
+        requeued - сколько недоставленных сообщений вернул в очередь этот запуск (повторная отправка):
+        они уже посчитаны в failed и получили новый результат.
+        """
+        run_rate = sent / duration if duration > 0 else 0.0
+        async with self._write() as db:
+            await db.execute(
+                "INSERT INTO broadcast_stats (job_id, sent, blocked, failed, duration, peak_rate, finished_at) "
+                "VALUES (?, ?, ?, ?, ?, "
+                "    MAX(COALESCE((SELECT MAX(sent) FROM broadcast_minutes WHERE job_id = ?), 0) / 60.0, ?), ?) "
+                "ON CONFLICT (job_id) DO UPDATE SET sent = sent + excluded.sent, "
+                "blocked = blocked + excluded.blocked, failed = MAX(0, failed + excluded.failed - ?), "
+                "duration = duration + excluded.duration, peak_rate = MAX(peak_rate, excluded.peak_rate), "
+                "finished_at = excluded.finished_at",
+                (job_id, sent, blocked, failed, duration, job_id, run_rate, int(time.time()), requeued)
+            )
+
+    async def get_broadcast_history(self, limit: int = 10) -> List[BroadcastStats]:
+        """Сводки последних рассылок, от новых к старым"""
+        async with self._reader() as db:
+            async with db.execute(
+                    "SELECT s.job_id, j.total, s.sent, s.blocked, s.failed, s.duration, s.peak_rate, s.finished_at "
+                    "FROM broadcast_stats s JOIN broadcast_jobs j ON j.id = s.job_id "
+                    "ORDER BY s.job_id DESC LIMIT ?", (limit,)) as cursor:
+                return [
+                    BroadcastStats(*row[:7], finished_at=datetime.fromtimestamp(row[7]))
+                    for row in await cursor.fetchall()
+                ]
+
+    async def get_broadcast_minutes(self, job_id: int) -> List[Tuple[datetime, int, int, int]]:
+        """Поминутные итоги рассылки: (минута, отправлено, заблокировали, ошибок)"""
+        async with self._reader() as db:
+            async with db.execute(
+                    "SELECT minute, sent, blocked, failed FROM broadcast_minutes WHERE job_id = ? ORDER BY minute",
+                    (job_id,)) as cursor:
+                return [
+                    (datetime.fromtimestamp(row[0] * 60), row[1], row[2], row[3])
+                    for row in await cursor.fetchall()
+                ]
 
     async def get_stats(self) -> dict:
         """Получение статистики"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Количество активных пользователей
-            async with db.execute("SELECT COUNT(*) FROM users WHERE is_active = 1") as cursor:
-                active_users = (await cursor.fetchone())[0]
-
-            # Последнее сообщение
-            message = await self.get_active_message()
-            last_message_date = message.created_date if message else None
-
-            return {
-                "active_users": active_users,
-                "last_message_date": last_message_date
-            }
\ No newline at end of file
+        # Количество активных пользователей
+        active_users = await self.count_users()
+
+        # Последнее сообщение
+        message = await self.get_active_message()
+        last_message_date = message.created_date if message else None
+
+        # Итоги последней рассылки
+        history = await self.get_broadcast_history(limit=1)
+
+        return {
+            "active_users": active_users,
+            "last_message_date": last_message_date,
+            "last_broadcast": history[0] if history else None
+        }
\ No newline at end of file
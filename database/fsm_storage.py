@@ -0,0 +1,58 @@
+from typing import Any, Dict, List, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from .cache import MISSING, LRUCache
+from .database import Database
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в базе бота с горячим кэшем в памяти и отложенной записью
+
+    Чтение из кэша стоит столько же, сколько в MemoryStorage; изменения уходят
+    в базу через буфер отложенной записи и переживают перезапуск. Кэш считается
+    источником истины внутри процесса, другие процессы видят состояние после сброса буфера.
+    """
+
+    def __init__(self, db: Database, cache_size: int = 10000):
+        self.db = db
+        self._cache = LRUCache(cache_size)
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join(
+            str(part) for part in (key.bot_id, key.chat_id, key.user_id, key.thread_id, key.destiny)
+        )
+
+    async def _record(self, key: StorageKey) -> List[Any]:
+        """Запись [state, data] из кэша или, при промахе, из базы"""
+        storage_key = self._key(key)
+        record = self._cache.get(storage_key)
+        if record is MISSING:
+            stored = await self.db.get_fsm_record(storage_key)
+            record = list(stored) if stored else [None, {}]
+            self._cache.set(storage_key, record)
+        return record
+
+    async def _save(self, key: StorageKey, record: List[Any]):
+        await self.db.defer_fsm_record(self._key(key), record[0], record[1])
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record[0] = state.state if isinstance(state, State) else state
+        await self._save(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._record(key)
+        record[1] = data.copy()
+        await self._save(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._record(key))[1].copy()
+
+    async def close(self) -> None:
+        await self.db.flush_writes()
@@ -0,0 +1,278 @@
+import logging
+from typing import List
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+# Миграции схемы: версия N = MIGRATIONS[N - 1], текущая версия хранится в PRAGMA user_version
+MIGRATIONS: List[List[str]] = [
+    # v1: исходная схема
+    [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT NOT NULL,
+            added_date TEXT NOT NULL,
+            is_active INTEGER DEFAULT 1
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            created_date TEXT NOT NULL,
+            is_active INTEGER DEFAULT 1
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            total INTEGER NOT NULL DEFAULT 0,
+            created_date TEXT NOT NULL,
+            finished_date TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+            job_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            PRIMARY KEY (job_id, user_id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_deliveries_pending "
+        "ON broadcast_deliveries (job_id, user_id) WHERE status = 'pending'",
+    ],
+    # v2: время в секундах epoch, уникальный username, частичные индексы
+    [
+        """
+        CREATE TABLE users_v2 (
+            id INTEGER PRIMARY KEY,
+            username TEXT COLLATE NOCASE UNIQUE,
+            first_name TEXT NOT NULL,
+            added_date INTEGER NOT NULL,
+            is_active INTEGER NOT NULL DEFAULT 1
+        )
+        """,
+        # Из дублей username оставляем его только у последнего добавленного пользователя
+        """
+        INSERT INTO users_v2 (id, username, first_name, added_date, is_active)
+        SELECT id,
+               CASE WHEN id = (
+                   SELECT u2.id FROM users u2
+                   WHERE u2.username = users.username COLLATE NOCASE
+                   ORDER BY u2.added_date DESC, u2.id DESC LIMIT 1
+               ) THEN username END,
+               first_name,
+               COALESCE(CAST(strftime('%s', added_date, 'utc') AS INTEGER), CAST(strftime('%s', 'now') AS INTEGER)),
+               COALESCE(is_active, 1)
+        FROM users
+        """,
+        "DROP TABLE users",
+        "ALTER TABLE users_v2 RENAME TO users",
+        "CREATE INDEX idx_users_active ON users (id) WHERE is_active = 1",
+        """
+        CREATE TABLE messages_v2 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            created_date INTEGER NOT NULL,
+            is_active INTEGER NOT NULL DEFAULT 1
+        )
+        """,
+        """
+        INSERT INTO messages_v2 (id, text, created_date, is_active)
+        SELECT id, text,
+               COALESCE(CAST(strftime('%s', created_date, 'utc') AS INTEGER), CAST(strftime('%s', 'now') AS INTEGER)),
+               COALESCE(is_active, 1)
+        FROM messages
+        """,
+        "DROP TABLE messages",
+        "ALTER TABLE messages_v2 RENAME TO messages",
+        "CREATE INDEX idx_messages_active ON messages (created_date) WHERE is_active = 1",
+        """
+        CREATE TABLE broadcast_jobs_v2 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            total INTEGER NOT NULL DEFAULT 0,
+            created_date INTEGER NOT NULL,
+            finished_date INTEGER
+        )
+        """,
+        """
+        INSERT INTO broadcast_jobs_v2 (id, message_id, status, total, created_date, finished_date)
+        SELECT id, message_id, status, total,
+               COALESCE(CAST(strftime('%s', created_date, 'utc') AS INTEGER), CAST(strftime('%s', 'now') AS INTEGER)),
+               CAST(strftime('%s', finished_date, 'utc') AS INTEGER)
+        FROM broadcast_jobs
+        """,
+        "DROP TABLE broadcast_jobs",
+        "ALTER TABLE broadcast_jobs_v2 RENAME TO broadcast_jobs",
+        "CREATE INDEX idx_broadcast_jobs_running ON broadcast_jobs (id) WHERE status = 'running'",
+    ],
+    # v3: диапазоны получателей для процессов-воркеров
+    [
+        """
+        CREATE TABLE broadcast_shards (
+            job_id INTEGER NOT NULL,
+            shard INTEGER NOT NULL,
+            start_id INTEGER NOT NULL,
+            end_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            worker TEXT,
+            heartbeat INTEGER,
+            PRIMARY KEY (job_id, shard)
+        )
+        """,
+        "CREATE INDEX idx_broadcast_shards_open ON broadcast_shards (job_id, shard) WHERE status != 'done'",
+    ],
+    # v4: кэш поиска chat id по username (chat_id NULL - пользователь не найден)
+    [
+        """
+        CREATE TABLE resolved_chats (
+            username TEXT PRIMARY KEY COLLATE NOCASE,
+            chat_id INTEGER,
+            first_name TEXT,
+            resolved_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """,
+    ],
+    # v5: состояния FSM
+    [
+        """
+        CREATE TABLE fsm_storage (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """,
+    ],
+    # v6: недоставленные сообщения для повторной отправки
+    [
+        """
+        CREATE TABLE dead_letters (
+            job_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            error TEXT NOT NULL,
+            created_date INTEGER NOT NULL,
+            PRIMARY KEY (job_id, user_id)
+        ) WITHOUT ROWID
+        """,
+    ],
+    # v7: медиа и форматирование сообщений рассылки
+    [
+        "ALTER TABLE messages ADD COLUMN content_type TEXT NOT NULL DEFAULT 'text'",
+        "ALTER TABLE messages ADD COLUMN entities TEXT",
+        "ALTER TABLE messages ADD COLUMN media TEXT",
+        "ALTER TABLE messages ADD COLUMN source_chat_id INTEGER",
+        "ALTER TABLE messages ADD COLUMN source_message_id INTEGER",
+    ],
+    # v8: теги пользователей для сегментированных рассылок
+    [
+        """
+        CREATE TABLE tags (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE COLLATE NOCASE
+        )
+        """,
+        """
+        CREATE TABLE user_tags (
+            tag_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (tag_id, user_id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX idx_user_tags_user ON user_tags (user_id, tag_id)",
+        # Покрывающий индекс для отбора активных по дате добавления (id - это rowid)
+        "CREATE INDEX idx_users_active_added ON users (added_date) WHERE is_active = 1",
+    ],
+    # v9: отложенные и растянутые во времени рассылки
+    [
+        """
+        CREATE TABLE scheduled_broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id INTEGER NOT NULL,
+            segment TEXT,
+            run_at INTEGER NOT NULL,
+            spread_seconds INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'scheduled',
+            job_id INTEGER,
+            created_date INTEGER NOT NULL
+        )
+        """,
+        "CREATE INDEX idx_scheduled_pending ON scheduled_broadcasts (run_at) WHERE status = 'scheduled'",
+        "CREATE INDEX idx_scheduled_jobs ON scheduled_broadcasts (job_id) WHERE job_id IS NOT NULL",
+    ],
+    # v10: переменные персонализации в тексте сообщения
+    [
+        "ALTER TABLE messages ADD COLUMN template_fields TEXT",
+    ],
+    # v11: сводная статистика рассылок по минутам и по заданиям
+    [
+        """
+        CREATE TABLE broadcast_minutes (
+            job_id INTEGER NOT NULL,
+            minute INTEGER NOT NULL,
+            sent INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (job_id, minute)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE broadcast_stats (
+            job_id INTEGER PRIMARY KEY,
+            sent INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            duration REAL NOT NULL DEFAULT 0,
+            peak_rate REAL NOT NULL DEFAULT 0,
+            finished_at INTEGER NOT NULL
+        )
+        """,
+        # Итоги уже завершенных рассылок по сохраненным статусам доставки
+        """
+        INSERT INTO broadcast_stats (job_id, sent, blocked, failed, duration, finished_at)
+        SELECT j.id,
+               SUM(d.status = 'sent'), SUM(d.status = 'blocked'), SUM(d.status = 'failed'),
+               MAX(j.finished_date - j.created_date, 0), j.finished_date
+        FROM broadcast_jobs j JOIN broadcast_deliveries d ON d.job_id = j.id
+        WHERE j.finished_date IS NOT NULL
+        GROUP BY j.id
+        """,
+    ],
+]
+
+
+async def migrate(db: aiosqlite.Connection):
+    """Применение недостающих миграций, каждой в отдельной транзакции
+
+    Воркеры запускаются одновременно с ботом, поэтому версия перечитывается
+    под блокировкой записи (BEGIN IMMEDIATE): миграцию, которую уже применил
+    другой процесс, повторно не выполняем.
+    """
+    async with db.execute("PRAGMA user_version") as cursor:
+        current = (await cursor.fetchone())[0]
+
+    for target, statements in enumerate(MIGRATIONS[current:], start=current + 1):
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            async with db.execute("PRAGMA user_version") as cursor:
+                version = (await cursor.fetchone())[0]
+            if version >= target:
+                await db.rollback()
+                continue
+
+            for statement in statements:
+                await db.execute(statement)
+            await db.execute(f"PRAGMA user_version = {target}")
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        logger.info(f"Схема базы данных обновлена до версии {target}")
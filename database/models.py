@@ -1,6 +1,6 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 @dataclass
 class User:
@@ -15,4 +15,70 @@ class Message:
     id: int
     text: str
     created_date: datetime
-    is_active: bool = True
\ No newline at end of file
+    is_active: bool = True
+    # text, photo, video, document, album, ... (text - подпись для медиа)
+    content_type: str = "text"
+    # Сущности форматирования в виде словарей MessageEntity
+    entities: List[dict] = field(default_factory=list)
+    # Загруженные в Telegram файлы: {"type": ..., "file_id": ...}, для альбома - по одному на элемент
+    media: List[dict] = field(default_factory=list)
+    # Исходное сообщение в чате админа для copy_message
+    source_chat_id: Optional[int] = None
+    source_message_id: Optional[int] = None
+    # Переменные шаблона ({first_name}, ...); None - текст отправляется как есть
+    template_fields: Optional[List[str]] = None
+
+@dataclass
+class BroadcastJob:
+    id: int
+    message_id: int
+    status: str
+    total: int
+    created_date: datetime
+    finished_date: Optional[datetime] = None
+
+@dataclass
+class BroadcastShard:
+    job_id: int
+    shard: int
+    start_id: int
+    end_id: int
+
+@dataclass
+class ResolvedChat:
+    username: str
+    chat_id: Optional[int]
+    first_name: Optional[str]
+    resolved_at: datetime
+
+@dataclass
+class Tag:
+    id: int
+    name: str
+    users: int = 0
+
+@dataclass
+class ScheduledBroadcast:
+    id: int
+    message_id: int
+    segment: Optional[dict]
+    run_at: datetime
+    spread_seconds: int
+    status: str
+    job_id: Optional[int] = None
+
+@dataclass
+class BroadcastStats:
+    job_id: int
+    total: int
+    sent: int
+    blocked: int
+    failed: int
+    duration: float
+    peak_rate: float
+    finished_at: datetime
+
+    @property
+    def rate(self) -> float:
+        """Средняя скорость отправки, сообщений в секунду"""
+        return self.sent / self.duration if self.duration else 0.0
@@ -0,0 +1,56 @@
+import time
+from typing import List, Optional, Tuple
+
+# Сегмент аудитории - словарь, который хранится в данных FSM:
+#   tags              - id тегов
+#   match_all         - нужны все теги (иначе любой из них)
+#   added_days        - > 0: добавлены за последние N дней, < 0: добавлены раньше N дней назад
+#   not_received_last - не получили последнюю рассылку
+EMPTY_SEGMENT = {"tags": [], "match_all": False, "added_days": 0, "not_received_last": False}
+
+
+def is_empty_segment(segment: Optional[dict]) -> bool:
+    return not segment or segment == EMPTY_SEGMENT
+
+
+def compile_segment(segment: Optional[dict], before_job_id: Optional[int] = None) -> Tuple[str, List]:
+    """Один запрос SELECT id активных пользователей сегмента и его параметры
+
+    Все условия проверяются по индексам: теги - по первичному ключу user_tags,
+    дата - по idx_users_active_added, доставка - по первичному ключу broadcast_deliveries.
+    before_job_id - id создаваемого задания, чтобы "последней рассылкой" считалась предыдущая.
+    """
+    conditions = ["is_active = 1"]
+    params: List = []
+    segment = segment or EMPTY_SEGMENT
+
+    tags = segment.get("tags") or []
+    if tags:
+        placeholders = ", ".join("?" * len(tags))
+        if segment.get("match_all") and len(tags) > 1:
+            conditions.append(
+                f"id IN (SELECT user_id FROM user_tags WHERE tag_id IN ({placeholders}) "
+                f"GROUP BY user_id HAVING COUNT(*) = ?)"
+            )
+            params.extend(tags)
+            params.append(len(tags))
+        else:
+            conditions.append(f"id IN (SELECT user_id FROM user_tags WHERE tag_id IN ({placeholders}))")
+            params.extend(tags)
+
+    added_days = segment.get("added_days") or 0
+    if added_days:
+        boundary = int(time.time()) - abs(added_days) * 86400
+        conditions.append("added_date >= ?" if added_days > 0 else "added_date < ?")
+        params.append(boundary)
+
+    if segment.get("not_received_last"):
+        last_job = "SELECT MAX(id) FROM broadcast_jobs"
+        if before_job_id is not None:
+            last_job += " WHERE id < ?"
+            params.append(before_job_id)
+        conditions.append(
+            f"id NOT IN (SELECT user_id FROM broadcast_deliveries WHERE job_id = ({last_job}) AND status = 'sent')"
+        )
+
+    return f"SELECT id FROM users WHERE {' AND '.join(conditions)}", params
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+Batches = Dict[str, List[tuple]]
+
+
+class WriteBehindBuffer:
+    """Буфер отложенной записи: копит операции и сбрасывает их одной транзакцией"""
+
+    def __init__(self, flush: Callable[[Batches], Awaitable], max_items: int, interval: float):
+        self._flush = flush
+        self.max_items = max(1, max_items)
+        self.interval = interval
+        self._batches: Batches = {}
+        self._size = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Запуск периодического сброса"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def add(self, sql: str, params: tuple):
+        """Постановка операции в очередь; при переполнении буфер сбрасывается сразу"""
+        self._batches.setdefault(sql, []).append(params)
+        self._size += 1
+        if self._size >= self.max_items:
+            await self.flush()
+
+    async def flush(self):
+        """Запись всех накопленных операций"""
+        async with self._lock:
+            if not self._size:
+                return
+
+            batches, self._batches, self._size = self._batches, {}, 0
+            try:
+                await self._flush(batches)
+            except Exception:
+                # Возвращаем операции в буфер, чтобы повторить при следующем сбросе
+                for sql, params in self._batches.items():
+                    batches.setdefault(sql, []).extend(params)
+                self._batches = batches
+                self._size = sum(len(params) for params in batches.values())
+                raise
+
+    async def close(self):
+        """Остановка периодического сброса и запись остатка"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка отложенной записи в базу: {e}")
@@ -1,20 +1,83 @@
+import asyncio
 import logging
+import os
+import tempfile
+import time
 from functools import wraps
+from typing import Awaitable, Dict, List, Optional, Set
 from aiogram import Router, F, Bot
-from aiogram.types import CallbackQuery, Message
+from aiogram.types import CallbackQuery, FSInputFile, Message
 from aiogram.fsm.context import FSMContext
-from aiogram.exceptions import TelegramBadRequest
 
 from config.settings import settings
 from database.database import Database
+from database.models import Tag
+from database.segments import EMPTY_SEGMENT, is_empty_segment
 from keyboards.admin_kb import (
-    get_admin_menu, get_users_menu, get_confirm_keyboard, get_back_keyboard
+    get_admin_menu, get_users_menu, get_back_keyboard, get_users_page_keyboard,
+    get_export_keyboard, get_stats_keyboard, get_dead_letters_keyboard, get_broadcast_control_keyboard,
+    get_tags_keyboard, get_broadcast_preview_keyboard, get_segment_keyboard, get_scheduled_keyboard,
+    get_history_keyboard
 )
+from services import metrics
+from services.broadcast import BroadcastResult, active_broadcasts, run_broadcast_job
+from services.content import describe_content, extract_content
+from services.export import export_users
+from services.importer import ImportResult, UserImporter
+from services.progress import BroadcastProgress
+from services.resolver import ChatResolver
+from services.scheduler import BroadcastScheduler, parse_schedule
 from states.admin_states import AdminStates
 
 logger = logging.getLogger(__name__)
 router = Router()
-db = Database(settings.DATABASE_URL)
+
+# Время жизни кэша счетчиков при рассылке воркерами, если CACHE_TTL не задан
+WORKERS_CACHE_TTL = 30
+
+db = Database(
+    settings.DATABASE_URL,
+    read_pool_size=settings.DB_READ_POOL_SIZE,
+    write_batch_size=settings.DB_WRITE_BATCH_SIZE,
+    write_interval=settings.DB_WRITE_INTERVAL_MS / 1000,
+    # Воркеры отключают заблокировавших бота в своих процессах, поэтому с ними
+    # счетчик пользователей в памяти главного процесса должен устаревать сам
+    cache_ttl=settings.CACHE_TTL or (WORKERS_CACHE_TTL if settings.BROADCAST_WORKERS > 0 else 0)
+)
+resolver = ChatResolver(db)
+scheduler = BroadcastScheduler(db, settings.SCHEDULER_INTERVAL)
+
+# Столбики графика поминутной скорости
+SPARK_BARS = "▁▂▃▄▅▆▇█"
+
+# Сколько ждать остальные элементы альбома, секунд
+ALBUM_COLLECT_DELAY = 1.0
+albums: Dict[str, List[Message]] = {}
+
+# Долгие операции (рассылки, импорт) идут в фоне, чтобы обработчик сразу освобождал
+# воркер обновлений; при остановке бота они отменяются
+background_tasks: Set[asyncio.Task] = set()
+
+
+def _log_background_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        logger.error(f"Ошибка фоновой операции: {task.exception()}")
+
+
+def run_in_background(operation: Awaitable):
+    """Запуск долгой операции после ответа обработчика"""
+    task = asyncio.ensure_future(operation)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    task.add_done_callback(_log_background_error)
+
+
+async def stop_background_tasks():
+    """Отмена фоновых операций; прерванные рассылки продолжатся после перезапуска"""
+    tasks = list(background_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
 
 
 def admin_only(func):
@@ -44,12 +107,14 @@ async def main_menu_handler(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(F.data == "manage_users")
-async def manage_users_handler(callback: CallbackQuery):
+async def manage_users_handler(callback: CallbackQuery, state: FSMContext):
     """Управление пользователями"""
     if callback.from_user.id != settings.ADMIN_ID:
         await callback.answer("❌ Доступ запрещен", show_alert=True)
         return
 
+    # Сюда возвращаются с экрана тегов, который ждет ввода
+    await state.clear()
     await callback.message.edit_text("👥 Управление пользователями:", reply_markup=get_users_menu())
     await callback.answer()
 
@@ -85,17 +150,17 @@ async def process_user_input(message: Message, state: FSMContext, bot: Bot):
         user_id = message.forward_from.id
         username = message.forward_from.username
         first_name = message.forward_from.first_name
+        if username:
+            await resolver.remember(username, user_id, first_name)
     elif message.text and message.text.startswith('@'):
-        # Username
-        username = message.text[1:]  # Убираем @
-        try:
-            # Пытаемся получить информацию о пользователе
-            chat = await bot.get_chat(username)
-            user_id = chat.id
-            first_name = chat.first_name
-        except TelegramBadRequest:
+        # Username (результат поиска кэшируется)
+        chat = await resolver.resolve(bot, message.text[1:])
+        if chat is None:
             await message.answer("❌ Пользователь не найден или не начинал диалог с ботом")
             return
+        user_id = chat.chat_id
+        username = chat.username
+        first_name = chat.first_name
     else:
         await message.answer("❌ Неверный формат. Отправьте @username или перешлите сообщение")
         return
@@ -112,81 +177,194 @@ async def process_user_input(message: Message, state: FSMContext, bot: Bot):
     await message.answer("Выберите действие:", reply_markup=get_admin_menu())
 
 
-@router.callback_query(F.data == "list_users")
-async def list_users_handler(callback: CallbackQuery):
-    """Список пользователей"""
-    if callback.from_user.id != settings.ADMIN_ID:
-        await callback.answer("❌ Доступ запрещен", show_alert=True)
+@router.callback_query(F.data == "import_users")
+@admin_only
+async def import_users_handler(callback: CallbackQuery, state: FSMContext):
+    """Импорт пользователей из файла"""
+    await state.set_state(AdminStates.waiting_for_import_file)
+    await callback.message.edit_text(
+        "📥 Импорт пользователей\n\n"
+        "Отправьте файл CSV или TXT: по одному id или @username в строке, "
+        "вторым столбцом можно указать имя.",
+        reply_markup=get_back_keyboard()
+    )
+    await callback.answer()
+
+
+@router.message(AdminStates.waiting_for_import_file, F.document)
+async def process_import_file(message: Message, state: FSMContext, bot: Bot):
+    """Обработка файла импорта"""
+    if message.from_user.id != settings.ADMIN_ID:
         return
 
-    users = await db.get_users()
+    await state.clear()
+    status = await message.answer("⏳ Загружаю файл...")
+    run_in_background(import_file(message, status, bot))
 
-    if not users:
-        await callback.message.edit_text("📋 Список пользователей пуст", reply_markup=get_back_keyboard())
-    else:
-        text = "📋 Список пользователей:\n\n"
-        for i, user in enumerate(users, 1):
-            username_text = f"@{user.username}" if user.username else "без username"
-            text += f"{i}. {user.first_name} ({username_text})\n"
 
-        text += f"\nВсего: {len(users)} пользователей"
+async def import_file(message: Message, status: Message, bot: Bot):
+    """Загрузка и импорт файла с обновлением сообщения о прогрессе"""
+    last_update = 0.0
+
+    async def report_progress(result: ImportResult):
+        nonlocal last_update
+        if time.monotonic() - last_update < settings.PROGRESS_INTERVAL:
+            return
+        last_update = time.monotonic()
+        await status.edit_text(
+            f"⏳ Обработано строк: {result.processed}\n"
+            f"✅ Добавлено: {result.added}\n"
+            f"❓ Не найдено: {result.not_found}"
+        )
+
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        await bot.download(message.document, destination=path)
+        result = await UserImporter(bot, db, resolver, report_progress).run(path)
+    except Exception as e:
+        logger.error(f"Ошибка импорта пользователей: {e}")
+        await status.edit_text("❌ Ошибка при импорте пользователей")
+        await message.answer("Выберите действие:", reply_markup=get_admin_menu())
+        return
+    finally:
+        os.remove(path)
+
+    text = "✅ Импорт завершен!\n\n"
+    text += f"📄 Строк в файле: {result.processed}\n"
+    text += f"👥 Добавлено: {result.added}\n"
+    if result.not_found:
+        text += f"❓ Не найдено: {result.not_found}\n"
+    if result.invalid:
+        text += f"⚠️ Некорректных строк: {result.invalid}"
+
+    await status.edit_text(text)
+    await message.answer("Выберите действие:", reply_markup=get_admin_menu())
+
+
+@router.message(AdminStates.waiting_for_import_file)
+async def process_import_invalid(message: Message):
+    """Сообщение без файла в режиме импорта"""
+    if message.from_user.id != settings.ADMIN_ID:
+        return
+
+    await message.answer("❌ Отправьте файл CSV или TXT", reply_markup=get_back_keyboard())
 
-        await callback.message.edit_text(text, reply_markup=get_back_keyboard())
 
+@router.callback_query(F.data == "manage_tags")
+@admin_only
+async def manage_tags_handler(callback: CallbackQuery, state: FSMContext):
+    """Теги пользователей"""
+    await state.set_state(AdminStates.waiting_for_tag_input)
+    tags = await db.get_tags()
+
+    text = "🏷 Теги пользователей\n\n"
+    if tags:
+        text += "\n".join(f"• {tag.name}: {tag.users}" for tag in tags) + "\n\n"
+    text += (
+        "Чтобы назначить тег, отправьте его название и список пользователей "
+        "(id или @username через пробел или с новой строки), например:\n"
+        "vip 123456789 @username"
+    )
+
+    await callback.message.edit_text(text, reply_markup=get_tags_keyboard(tags))
     await callback.answer()
 
 
-@router.callback_query(F.data == "delete_user")
-async def delete_user_handler(callback: CallbackQuery, state: FSMContext):
-    """Удаление пользователя"""
-    if callback.from_user.id != settings.ADMIN_ID:
-        await callback.answer("❌ Доступ запрещен", show_alert=True)
+@router.message(AdminStates.waiting_for_tag_input)
+async def process_tag_input(message: Message, state: FSMContext):
+    """Назначение тега пользователям"""
+    if message.from_user.id != settings.ADMIN_ID:
         return
 
-    users = await db.get_users()
+    tokens = (message.text or "").split()
+    if len(tokens) < 2:
+        await message.answer("❌ Укажите тег и хотя бы одного пользователя", reply_markup=get_back_keyboard())
+        return
+
+    name = tokens[0].lstrip("#")
+    user_ids = [int(token) for token in tokens[1:] if token.isdigit()]
+    usernames = [token.lstrip("@") for token in tokens[1:] if not token.isdigit()]
+
+    tagged = await db.tag_users(name, user_ids, usernames)
+
+    await state.clear()
+    await message.answer(f"✅ Тег «{name}» назначен пользователям: {tagged}")
+    await message.answer("Выберите действие:", reply_markup=get_users_menu())
+
+
+@router.callback_query(F.data.startswith("del_tag:"))
+@admin_only
+async def delete_tag_handler(callback: CallbackQuery, state: FSMContext):
+    """Удаление тега"""
+    await db.delete_tag(int(callback.data.split(":")[1]))
+    await manage_tags_handler(callback, state)
+
+
+async def show_users_page(callback: CallbackQuery, mode: str, after_id: int = 0, before_id: int = None):
+    """Вывод одной страницы пользователей"""
+    users, has_prev, has_next = await db.get_users_page(after_id, before_id, settings.USERS_PAGE_SIZE)
 
     if not users:
-        await callback.message.edit_text("❌ Нет пользователей для удаления", reply_markup=get_back_keyboard())
-        await callback.answer()
+        empty_text = "📋 Список пользователей пуст" if mode == "list" else "❌ Нет пользователей для удаления"
+        await callback.message.edit_text(empty_text, reply_markup=get_back_keyboard())
         return
 
-    await state.set_state(AdminStates.waiting_for_user_delete)
+    if mode == "list":
+        text = "📋 Список пользователей:\n\n"
+        for user in users:
+            username_text = f"@{user.username}" if user.username else "без username"
+            text += f"• {user.first_name} ({username_text}) - ID: {user.id}\n"
+    else:
+        text = "❌ Удаление пользователя\n\nНажмите на пользователя, чтобы удалить его:"
+
+    await callback.message.edit_text(
+        text, reply_markup=get_users_page_keyboard(users, mode, has_prev, has_next)
+    )
 
-    text = "❌ Удаление пользователя\n\nВыберите номер пользователя для удаления:\n\n"
-    for i, user in enumerate(users, 1):
-        username_text = f"@{user.username}" if user.username else "без username"
-        text += f"{i}. {user.first_name} ({username_text})\n"
 
-    await callback.message.edit_text(text, reply_markup=get_back_keyboard())
+@router.callback_query(F.data == "list_users")
+@admin_only
+async def list_users_handler(callback: CallbackQuery):
+    """Список пользователей"""
+    await show_users_page(callback, "list")
     await callback.answer()
 
 
-@router.message(AdminStates.waiting_for_user_delete)
-async def process_user_delete(message: Message, state: FSMContext):
-    """Обработка удаления пользователя"""
-    if message.from_user.id != settings.ADMIN_ID:
-        return
+@router.callback_query(F.data == "delete_user")
+@admin_only
+async def delete_user_handler(callback: CallbackQuery):
+    """Удаление пользователя"""
+    await show_users_page(callback, "delete")
+    await callback.answer()
 
-    try:
-        user_index = int(message.text) - 1
-        users = await db.get_users()
 
-        if 0 <= user_index < len(users):
-            user = users[user_index]
-            success = await db.delete_user(user.id)
+@router.callback_query(F.data.startswith("users_page:"))
+@admin_only
+async def users_page_handler(callback: CallbackQuery):
+    """Переход по страницам списка пользователей"""
+    _, mode, direction, cursor = callback.data.split(":")
 
-            if success:
-                await message.answer(f"✅ Пользователь {user.first_name} удален!")
-            else:
-                await message.answer("❌ Ошибка при удалении пользователя")
-        else:
-            await message.answer("❌ Неверный номер пользователя")
+    if direction == "before":
+        await show_users_page(callback, mode, before_id=int(cursor))
+    else:
+        await show_users_page(callback, mode, after_id=int(cursor))
+    await callback.answer()
 
-    except ValueError:
-        await message.answer("❌ Введите номер пользователя")
 
-    await state.clear()
-    await message.answer("Выберите действие:", reply_markup=get_admin_menu())
+@router.callback_query(F.data.startswith("del_user:"))
+@admin_only
+async def process_user_delete(callback: CallbackQuery):
+    """Обработка удаления пользователя"""
+    _, user_id, page_cursor = callback.data.split(":")
+
+    user = await db.get_user(int(user_id))
+    if user and await db.delete_user(user.id):
+        await callback.answer(f"✅ Пользователь {user.first_name} удален!")
+    else:
+        await callback.answer("❌ Ошибка при удалении пользователя", show_alert=True)
+
+    await show_users_page(callback, "delete", after_id=int(page_cursor))
 
 
 @router.callback_query(F.data == "set_message")
@@ -198,11 +376,12 @@ async def set_message_handler(callback: CallbackQuery, state: FSMContext):
     current_message = await db.get_active_message()
     current_text = ""
     if current_message:
-        current_text = f"\n\nТекущее сообщение:\n{current_message.text}"
+        current_text = f"\n\nТекущее сообщение:\n{describe_content(current_message)}"
 
     await callback.message.edit_text(
         f"💬 Настройка сообщения для рассылки{current_text}\n\n"
-        "Отправьте новое сообщение:",
+        "Отправьте новое сообщение (можно с фото, видео, файлом или альбомом).\n"
+        "Для персонализации используйте {first_name}, {username} и {id}:",
         reply_markup=get_back_keyboard()
     )
     await callback.answer()
@@ -214,7 +393,29 @@ async def process_message_input(message: Message, state: FSMContext):
     if message.from_user.id != settings.ADMIN_ID:
         return
 
-    success = await db.save_message(message.text)
+    if message.media_group_id:
+        # Элементы альбома приходят отдельными сообщениями - собираем их, сохраняет первый обработчик
+        album = albums.setdefault(message.media_group_id, [])
+        album.append(message)
+        if len(album) > 1:
+            return
+        await asyncio.sleep(ALBUM_COLLECT_DELAY)
+        messages = sorted(albums.pop(message.media_group_id), key=lambda item: item.message_id)
+    else:
+        messages = [message]
+
+    try:
+        content = extract_content(messages)
+    except ValueError as e:
+        await message.answer(
+            f"❌ Неизвестная переменная {{{e}}}\n\n"
+            "Доступны {first_name}, {username} и {id}. "
+            "Чтобы вывести фигурные скобки как есть, удвойте их: {{ и }}",
+            reply_markup=get_back_keyboard()
+        )
+        return
+
+    success = await db.save_message(**content)
 
     if success:
         await message.answer("✅ Сообщение сохранено!")
@@ -236,59 +437,287 @@ async def broadcast_handler(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
         return
 
-    users = await db.get_users()
+    segment = (await state.get_data()).get("segment")
+    users_count = await db.count_segment(segment)
 
-    if not users:
+    if not users_count and is_empty_segment(segment):
         await callback.message.edit_text("❌ Нет пользователей для рассылки", reply_markup=get_back_keyboard())
         await callback.answer()
         return
 
     await state.set_state(AdminStates.confirming_broadcast)
 
-    preview_text = f"📤 Предпросмотр рассылки:\n\n{'-' * 30}\n{message_obj.text}\n{'-' * 30}\n\n"
-    preview_text += f"Будет отправлено {len(users)} пользователям.\n\nПродолжить?"
+    preview_text = f"📤 Предпросмотр рассылки:\n\n{'-' * 30}\n{describe_content(message_obj)}\n{'-' * 30}\n\n"
+    if not is_empty_segment(segment):
+        preview_text += f"🎯 Аудитория: {describe_segment(segment, await db.get_tags())}\n"
+    preview_text += f"Будет отправлено {users_count} пользователям.\n\nПродолжить?"
+
+    await callback.message.edit_text(preview_text, reply_markup=get_broadcast_preview_keyboard())
+    await callback.answer()
+
+
+def describe_segment(segment: dict, tags: List[Tag]) -> str:
+    """Текстовое описание условий сегмента"""
+    parts = []
+    names = [tag.name for tag in tags if tag.id in segment["tags"]]
+    if names:
+        parts.append(("все теги: " if segment["match_all"] else "теги: ") + ", ".join(names))
+    if segment["added_days"] > 0:
+        parts.append(f"добавлены за {segment['added_days']} дн.")
+    elif segment["added_days"] < 0:
+        parts.append(f"добавлены раньше {-segment['added_days']} дн. назад")
+    if segment["not_received_last"]:
+        parts.append("не получили прошлую рассылку")
+    return "; ".join(parts) or "все активные"
+
+
+@router.callback_query(F.data == "segment")
+@admin_only
+async def segment_handler(callback: CallbackQuery, state: FSMContext):
+    """Конструктор аудитории рассылки"""
+    segment = (await state.get_data()).get("segment") or dict(EMPTY_SEGMENT)
+    tags = await db.get_tags()
+    users_count = await db.count_segment(segment)
+
+    text = "🎯 Аудитория рассылки\n\n"
+    text += f"{describe_segment(segment, tags)}\n"
+    text += f"👥 Получателей: {users_count}"
+    if not tags:
+        text += "\n\nТеги назначаются в разделе «Управление пользователями»"
+
+    await callback.message.edit_text(text, reply_markup=get_segment_keyboard(segment, tags))
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("seg:"))
+@admin_only
+async def segment_update_handler(callback: CallbackQuery, state: FSMContext):
+    """Изменение условия сегмента"""
+    segment = (await state.get_data()).get("segment") or dict(EMPTY_SEGMENT)
+    action, _, value = callback.data[len("seg:"):].partition(":")
+
+    if action == "tag":
+        tag_id = int(value)
+        segment["tags"] = [t for t in segment["tags"] if t != tag_id] if tag_id in segment["tags"] \
+            else segment["tags"] + [tag_id]
+    elif action == "all":
+        segment["match_all"] = not segment["match_all"]
+    elif action == "added":
+        days = int(value)
+        segment["added_days"] = 0 if segment["added_days"] == days else days
+    elif action == "unreceived":
+        segment["not_received_last"] = not segment["not_received_last"]
+    else:
+        segment = dict(EMPTY_SEGMENT)
+
+    await state.update_data(segment=segment)
+    await segment_handler(callback, state)
+
+
+@router.callback_query(F.data == "schedule")
+@admin_only
+async def schedule_handler(callback: CallbackQuery, state: FSMContext):
+    """Планирование рассылки"""
+    await state.set_state(AdminStates.waiting_for_schedule)
+    await callback.message.edit_text(
+        "🕒 Планирование рассылки\n\n"
+        "Отправьте время начала в формате ДД.ММ ЧЧ:ММ (или ДД.ММ.ГГГГ ЧЧ:ММ, или «сейчас»).\n"
+        "Чтобы растянуть отправку, добавьте через пробел число часов, например:\n"
+        "25.12 10:00 3",
+        reply_markup=get_back_keyboard()
+    )
+    await callback.answer()
+
+
+@router.message(AdminStates.waiting_for_schedule)
+async def process_schedule_input(message: Message, state: FSMContext):
+    """Обработка времени запланированной рассылки"""
+    if message.from_user.id != settings.ADMIN_ID:
+        return
+
+    try:
+        run_at, spread_seconds = parse_schedule(message.text or "")
+    except ValueError:
+        await message.answer("❌ Не удалось разобрать время, попробуйте еще раз", reply_markup=get_back_keyboard())
+        return
+
+    message_obj = await db.get_active_message()
+    segment = (await state.get_data()).get("segment")
+    scheduled_id = await db.create_scheduled_broadcast(message_obj.id, run_at, spread_seconds, segment)
+    scheduler.wake()
+    await state.clear()
+
+    text = f"✅ Рассылка #{scheduled_id} запланирована на {run_at.strftime('%d.%m.%Y %H:%M')}"
+    if spread_seconds:
+        text += f", отправка растянется на {spread_seconds / 3600:g} ч"
+    await message.answer(text)
+    await message.answer("Выберите действие:", reply_markup=get_admin_menu())
+
+
+@router.callback_query(F.data == "scheduled")
+@admin_only
+async def scheduled_handler(callback: CallbackQuery):
+    """Список запланированных рассылок"""
+    items = await db.get_scheduled_broadcasts()
 
-    await callback.message.edit_text(preview_text, reply_markup=get_confirm_keyboard("broadcast"))
+    if not items:
+        text = "📅 Запланированных рассылок нет"
+    else:
+        text = "📅 Запланированные рассылки\n\n"
+        for item in items:
+            text += f"#{item.id}: {item.run_at.strftime('%d.%m.%Y %H:%M')}"
+            if item.spread_seconds:
+                text += f", в течение {item.spread_seconds / 3600:g} ч"
+            if item.status == "running":
+                text += " (идет отправка)"
+            text += "\n"
+
+    await callback.message.edit_text(text, reply_markup=get_scheduled_keyboard(items))
     await callback.answer()
 
 
+@router.callback_query(F.data.startswith("sched_cancel:"))
+@admin_only
+async def scheduled_cancel_handler(callback: CallbackQuery):
+    """Отмена запланированной рассылки"""
+    scheduled_id = int(callback.data.split(":")[1])
+
+    item = next((item for item in await db.get_scheduled_broadcasts() if item.id == scheduled_id), None)
+    if item and await db.finish_scheduled(scheduled_id, "cancelled"):
+        broadcaster = active_broadcasts.get(item.job_id)
+        if broadcaster:
+            broadcaster.cancel()
+
+    await scheduled_handler(callback)
+
+
 @router.callback_query(F.data == "confirm_broadcast")
 @admin_only
 async def confirm_broadcast_handler(callback: CallbackQuery, state: FSMContext, bot: Bot):
     """Подтверждение рассылки"""
+    segment = (await state.get_data()).get("segment")
     await state.clear()
 
     message_obj = await db.get_active_message()
-    users = await db.get_users()
 
-    await callback.message.edit_text("📤 Начинаю рассылку...", reply_markup=None)
+    if settings.BROADCAST_WORKERS > 0:
+        # Отправкой занимаются процессы worker.py, бот остается отзывчивым
+        job = await db.create_broadcast_job(message_obj.id, shards=settings.BROADCAST_SHARDS, segment=segment)
+        await callback.message.edit_text(
+            f"📤 Рассылка #{job.id} на {job.total} получателей передана воркерам.\n"
+            "Отчет придет по завершении.",
+            reply_markup=get_admin_menu()
+        )
+        await callback.answer()
+        return
 
-    sent_count = 0
-    blocked_count = 0
+    job = await db.create_broadcast_job(message_obj.id, segment=segment)
+    # Отвечаем сразу: к концу рассылки callback query уже устареет
+    await callback.answer()
+
+    run_in_background(run_with_progress(
+        callback.message, bot, job.id, job.total, "📤 Начинаю рассылку...", "✅ Рассылка завершена!"
+    ))
+
+
+async def run_with_progress(message: Message, bot: Bot, job_id: int, total: int, title: str, done_title: str,
+                            user_ids: Optional[List[int]] = None):
+    """Отправка задания с обновлением сообщения о прогрессе, кнопками управления и итогами"""
+    await message.edit_text(title, reply_markup=get_broadcast_control_keyboard(job_id, paused=False))
+
+    progress = BroadcastProgress(message, job_id, total, settings.PROGRESS_INTERVAL)
+    progress.start()
+    try:
+        result = await run_broadcast_job(bot, db, await db.get_job(job_id), user_ids=user_ids)
+    finally:
+        await progress.stop()
+
+    await message.edit_text(format_broadcast_result(done_title, result), reply_markup=get_admin_menu())
+
+
+@router.callback_query(F.data.startswith("bc_"))
+@admin_only
+async def broadcast_control_handler(callback: CallbackQuery):
+    """Пауза, продолжение и остановка идущей рассылки"""
+    action, job_id = callback.data.split(":")
+    broadcaster = active_broadcasts.get(int(job_id))
+    if broadcaster is None:
+        await callback.answer("Рассылка уже завершена")
+        return
+
+    if action == "bc_cancel":
+        broadcaster.cancel()
+        await callback.message.edit_reply_markup(reply_markup=None)
+        await callback.answer("⛔ Рассылка останавливается")
+        return
+
+    if action == "bc_pause":
+        broadcaster.pause()
+        await callback.answer("⏸ Рассылка приостановлена")
+    else:
+        broadcaster.resume()
+        await callback.answer("▶️ Рассылка продолжена")
+    await callback.message.edit_reply_markup(
+        reply_markup=get_broadcast_control_keyboard(int(job_id), broadcaster.paused)
+    )
+
+
+def format_broadcast_result(title: str, result: BroadcastResult) -> str:
+    """Текст с итогами рассылки"""
+    if result.cancelled:
+        title = "⛔ Рассылка остановлена, оставшимся получателям сообщение не отправлено"
+    result_text = f"{title}\n\n"
+    result_text += f"📤 Отправлено: {result.sent}\n"
+    if result.blocked > 0:
+        result_text += f"🚫 Заблокировали бота: {result.blocked}\n"
+    if result.failed > 0:
+        result_text += f"⚠️ Не доставлено: {result.failed}\n"
+    result_text += f"⏱ Время: {result.duration:.1f} с ({result.rate:.1f} сообщ./с)"
+    return result_text
+
+
+@router.callback_query(F.data == "dead_letters")
+@admin_only
+async def dead_letters_handler(callback: CallbackQuery):
+    """Список рассылок с недоставленными сообщениями"""
+    jobs = await db.get_dead_letter_jobs()
+
+    if not jobs:
+        text = "♻️ Недоставленных сообщений нет"
+    else:
+        text = "♻️ Недоставленные сообщения\n\nВыберите рассылку для повторной отправки:"
+
+    await callback.message.edit_text(text, reply_markup=get_dead_letters_keyboard(jobs))
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("redrive:"))
+@admin_only
+async def redrive_handler(callback: CallbackQuery, bot: Bot):
+    """Повторная отправка недоставленных сообщений рассылки"""
+    job_id = int(callback.data.split(":")[1])
+
+    job = await db.get_job(job_id)
+    if job is None or job.status not in ("done", "cancelled") or job_id in active_broadcasts:
+        await callback.answer("Рассылка еще идет, повторить можно после ее завершения", show_alert=True)
+        return
+
+    requeued = await db.requeue_dead_letters(job_id)
+    if not requeued:
+        # Все получатели рассылки стали неактивными - убираем ее из списка
+        jobs = await db.get_dead_letter_jobs()
+        await callback.message.edit_reply_markup(reply_markup=get_dead_letters_keyboard(jobs))
+        await callback.answer("Некому отправлять повторно", show_alert=True)
+        return
 
-    for user in users:
-        try:
-            await bot.send_message(user.id, message_obj.text)
-            sent_count += 1
-        except TelegramBadRequest as e:
-            if "blocked" in str(e).lower():
-                blocked_count += 1
-                # Деактивируем заблокированного пользователя
-                await db.delete_user(user.id)
-                logger.info(f"Пользователь {user.id} заблокировал бота")
-            else:
-                logger.error(f"Ошибка отправки пользователю {user.id}: {e}")
-        except Exception as e:
-            logger.error(f"Неожиданная ошибка при отправке пользователю {user.id}: {e}")
-
-    result_text = f"✅ Рассылка завершена!\n\n"
-    result_text += f"📤 Отправлено: {sent_count}\n"
-    if blocked_count > 0:
-        result_text += f"🚫 Заблокировали бота: {blocked_count}"
-
-    await callback.message.edit_text(result_text, reply_markup=get_admin_menu())
     await callback.answer()
 
+    run_in_background(run_with_progress(
+        callback.message, bot, job_id, len(requeued),
+        f"🔁 Повторная отправка {len(requeued)} сообщений рассылки #{job_id}...",
+        f"✅ Повторная отправка рассылки #{job_id} завершена!", user_ids=requeued
+    ))
+
 
 @router.callback_query(F.data == "stats")
 @admin_only
@@ -304,43 +733,149 @@ async def stats_handler(callback: CallbackQuery):
     else:
         text += "📅 Сообщений еще не было"
 
-    await callback.message.edit_text(text, reply_markup=get_back_keyboard())
+    last = stats['last_broadcast']
+    if last:
+        text += f"\n\n📤 Последняя рассылка #{last.job_id} ({last.finished_at.strftime('%d.%m.%Y %H:%M')}):\n"
+        text += f"доставлено {last.sent} из {last.total}, {last.rate:.1f} сообщ./с"
+
+    await callback.message.edit_text(text, reply_markup=get_stats_keyboard())
     await callback.answer()
 
 
-@router.callback_query(F.data == "export_users")
+def trend(current: float, previous: Optional[float]) -> str:
+    """Стрелка изменения относительно предыдущего значения"""
+    if previous is None or abs(current - previous) < 0.005 * max(abs(previous), 1):
+        return ""
+    return " ↑" if current > previous else " ↓"
+
+
+@router.callback_query(F.data == "broadcast_history")
 @admin_only
-async def export_users_handler(callback: CallbackQuery):
-    """Экспорт списка пользователей"""
-    users = await db.get_users()
+async def broadcast_history_handler(callback: CallbackQuery):
+    """Итоги последних рассылок со сравнением с предыдущей"""
+    history = await db.get_broadcast_history(settings.STATS_HISTORY_SIZE)
 
-    if not users:
-        await callback.message.edit_text("❌ Нет пользователей для экспорта", reply_markup=get_back_keyboard())
+    if not history:
+        await callback.message.edit_text("📈 Рассылок еще не было", reply_markup=get_history_keyboard(history))
         await callback.answer()
         return
 
-    export_text = "📄 Экспорт пользователей:\n\n"
+    text = f"📈 Последние рассылки ({len(history)})\n\n"
+    for stats, previous in zip(history, history[1:] + [None]):
+        delivered = stats.sent / stats.total * 100 if stats.total else 0.0
+        previous_delivered = None
+        if previous:
+            previous_delivered = previous.sent / previous.total * 100 if previous.total else 0.0
+        text += f"#{stats.job_id} {stats.finished_at.strftime('%d.%m %H:%M')}: "
+        text += f"{stats.sent}/{stats.total} ({delivered:.0f}%{trend(delivered, previous_delivered)})"
+        if stats.blocked:
+            text += f", 🚫 {stats.blocked}"
+        if stats.failed:
+            text += f", ⚠️ {stats.failed}"
+        text += f", {stats.rate:.1f} сообщ./с{trend(stats.rate, previous.rate if previous else None)}\n"
+
+    total_sent = sum(stats.sent for stats in history)
+    total_blocked = sum(stats.blocked for stats in history)
+    text += f"\nВсего отправлено: {total_sent}, заблокировали бота: {total_blocked}"
+
+    await callback.message.edit_text(text, reply_markup=get_history_keyboard(history))
+    await callback.answer()
 
-    for i, user in enumerate(users, 1):
-        username_text = f"@{user.username}" if user.username else "без username"
-        export_text += f"{i}. {user.first_name} ({username_text}) - ID: {user.id}\n"
-        export_text += f"   Добавлен: {user.added_date.strftime('%d.%m.%Y %H:%M')}\n\n"
 
-    export_text += f"Всего пользователей: {len(users)}"
+@router.callback_query(F.data.startswith("stats_job:"))
+@admin_only
+async def broadcast_stats_handler(callback: CallbackQuery):
+    """Поминутная скорость отправки рассылки"""
+    job_id = int(callback.data.split(":")[1])
+    minutes = await db.get_broadcast_minutes(job_id)
+    history = await db.get_broadcast_history(settings.STATS_HISTORY_SIZE)
+    stats = next((stats for stats in history if stats.job_id == job_id), None)
+
+    text = f"📈 Рассылка #{job_id}\n\n"
+    if stats:
+        text += f"📤 Отправлено: {stats.sent} из {stats.total}\n"
+        text += f"🚫 Заблокировали бота: {stats.blocked}\n"
+        text += f"⚠️ Не доставлено: {stats.failed}\n"
+        text += f"⏱ Время: {stats.duration:.1f} с, в среднем {stats.rate:.1f} сообщ./с"
+        # У рассылок до появления поминутной статистики пика нет
+        text += f", пик {stats.peak_rate:.1f}\n" if stats.peak_rate else "\n"
+
+    if minutes:
+        # Не больше 30 последних минут, чтобы график помещался в сообщение
+        shown = minutes[-30:]
+        peak = max(sent for _, sent, _, _ in shown) or 1
+        bars = "".join(SPARK_BARS[sent * (len(SPARK_BARS) - 1) // peak] for _, sent, _, _ in shown)
+        text += f"\nОтправлено по минутам с {shown[0][0].strftime('%H:%M')}:\n{bars}"
+
+    await callback.message.edit_text(text, reply_markup=get_history_keyboard([], back="broadcast_history"))
+    await callback.answer()
 
-    # Если текст слишком длинный, разбиваем на части
-    if len(export_text) > 4000:
-        await callback.message.edit_text("📄 Список пользователей (первая часть):")
 
-        parts = [export_text[i:i + 4000] for i in range(0, len(export_text), 4000)]
-        for i, part in enumerate(parts):
-            if i == 0:
-                await callback.message.edit_text(part)
-            else:
-                await callback.message.answer(part)
+@router.callback_query(F.data == "perf_stats")
+@admin_only
+async def perf_stats_handler(callback: CallbackQuery):
+    """Время работы обработчиков, запросов к базе и счетчики рассылки"""
+    text = "⏱ Производительность\n\n"
+
+    for title, histogram in (("Обработчики", metrics.handler_latency), ("База данных", metrics.db_latency)):
+        # Самые медленные в среднем
+        rows = sorted(histogram.summary(), key=lambda row: row[2], reverse=True)[:8]
+        if rows:
+            text += f"{title} (среднее / p99):\n"
+            for (name,), count, avg, p99 in rows:
+                text += f"• {name}: {avg * 1000:.1f} / ≤{p99 * 1000:g} мс ({count})\n"
+            text += "\n"
+
+    text += "📤 Рассылка:\n"
+    text += f"Отправлено: {metrics.broadcast_messages.get(status='sent'):.0f}\n"
+    text += f"Заблокировали: {metrics.broadcast_messages.get(status='blocked'):.0f}\n"
+    text += f"Ошибок: {metrics.broadcast_messages.get(status='failed'):.0f}\n"
+    text += f"Повторов: {metrics.broadcast_retries.get():.0f}\n"
+    text += f"В процессе: {metrics.broadcast_in_flight.get():.0f}\n"
+    text += f"Скорость: {metrics.broadcast_rate.get():.1f} сообщ./с"
 
-        await callback.message.answer("Выберите действие:", reply_markup=get_admin_menu())
-    else:
-        await callback.message.edit_text(export_text, reply_markup=get_back_keyboard())
+    await callback.message.edit_text(text, reply_markup=get_back_keyboard())
+    await callback.answer()
+
+
+@router.callback_query(F.data == "export_users")
+@admin_only
+async def export_users_handler(callback: CallbackQuery):
+    """Экспорт списка пользователей"""
+    await callback.message.edit_text("📄 Выберите формат экспорта:", reply_markup=get_export_keyboard())
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("export_users:"))
+@admin_only
+async def export_format_handler(callback: CallbackQuery):
+    """Выгрузка пользователей файлом"""
+    fmt = callback.data.split(":")[1]
+
+    await callback.message.edit_text("⏳ Формирую файл...")
+    await callback.answer()
+    run_in_background(send_export(callback.message, fmt))
 
-    await callback.answer()
\ No newline at end of file
+
+async def send_export(message: Message, fmt: str):
+    """Формирование и отправка файла выгрузки"""
+    try:
+        path, filename, count = await export_users(db, fmt)
+        try:
+            if not count:
+                await message.edit_text("❌ Нет пользователей для экспорта", reply_markup=get_back_keyboard())
+                return
+
+            await message.answer_document(
+                FSInputFile(path, filename=filename),
+                caption=f"📄 Экспорт пользователей: {count}"
+            )
+        finally:
+            os.remove(path)
+    except Exception as e:
+        logger.error(f"Ошибка экспорта пользователей: {e}")
+        await message.edit_text("❌ Ошибка при экспорте пользователей", reply_markup=get_back_keyboard())
+        return
+
+    await message.delete()
+    await message.answer("Выберите действие:", reply_markup=get_admin_menu())
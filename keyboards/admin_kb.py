@@ -1,11 +1,17 @@
+from typing import List, Tuple
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+from database.models import BroadcastStats, ScheduledBroadcast, Tag, User
+
 def get_admin_menu() -> InlineKeyboardMarkup:
     """Главное меню админа"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="👥 Управление пользователями", callback_data="manage_users")],
         [InlineKeyboardButton(text="💬 Настройка сообщения", callback_data="set_message")],
         [InlineKeyboardButton(text="📤 Отправить всем", callback_data="broadcast")],
+        [InlineKeyboardButton(text="📅 Запланированные", callback_data="scheduled")],
+        [InlineKeyboardButton(text="♻️ Недоставленные", callback_data="dead_letters")],
         [InlineKeyboardButton(text="📊 Статистика", callback_data="stats")]
     ])
     return keyboard
@@ -14,6 +20,8 @@ def get_users_menu() -> InlineKeyboardMarkup:
     """Меню управления пользователями"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="➕ Добавить пользователя", callback_data="add_user")],
+        [InlineKeyboardButton(text="📥 Импорт из файла", callback_data="import_users")],
+        [InlineKeyboardButton(text="🏷 Теги", callback_data="manage_tags")],
         [InlineKeyboardButton(text="❌ Удалить пользователя", callback_data="delete_user")],
         [InlineKeyboardButton(text="📋 Список пользователей", callback_data="list_users")],
         [InlineKeyboardButton(text="📄 Экспорт списка", callback_data="export_users")],
@@ -21,16 +29,140 @@ def get_users_menu() -> InlineKeyboardMarkup:
     ])
     return keyboard
 
-def get_confirm_keyboard(action: str) -> InlineKeyboardMarkup:
-    """Клавиатура подтверждения"""
+def get_users_page_keyboard(users: List[User], mode: str, has_prev: bool, has_next: bool) -> InlineKeyboardMarkup:
+    """Постраничный просмотр пользователей (mode: list или delete)"""
+    inline_keyboard = []
+
+    if mode == "delete":
+        # После удаления показываем ту же страницу
+        page_cursor = users[0].id - 1
+        for user in users:
+            username_text = f"@{user.username}" if user.username else "без username"
+            inline_keyboard.append([InlineKeyboardButton(
+                text=f"❌ {user.first_name} ({username_text})",
+                callback_data=f"del_user:{user.id}:{page_cursor}"
+            )])
+
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton(text="◀️", callback_data=f"users_page:{mode}:before:{users[0].id}"))
+    if has_next:
+        navigation.append(InlineKeyboardButton(text="▶️", callback_data=f"users_page:{mode}:after:{users[-1].id}"))
+    if navigation:
+        inline_keyboard.append(navigation)
+
+    inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="manage_users")])
+    return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+
+def get_export_keyboard() -> InlineKeyboardMarkup:
+    """Выбор формата экспорта"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text="✅ Да", callback_data=f"confirm_{action}"),
+            InlineKeyboardButton(text="CSV", callback_data="export_users:csv"),
+            InlineKeyboardButton(text="JSONL", callback_data="export_users:jsonl")
+        ],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="manage_users")]
+    ])
+    return keyboard
+
+def get_stats_keyboard() -> InlineKeyboardMarkup:
+    """Меню статистики"""
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📈 История рассылок", callback_data="broadcast_history")],
+        [InlineKeyboardButton(text="⏱ Производительность", callback_data="perf_stats")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="main_menu")]
+    ])
+    return keyboard
+
+def get_history_keyboard(history: List[BroadcastStats], back: str = "stats") -> InlineKeyboardMarkup:
+    """Подробности рассылок из истории"""
+    inline_keyboard = []
+    for i in range(0, len(history), 5):
+        inline_keyboard.append([
+            InlineKeyboardButton(text=f"#{stats.job_id}", callback_data=f"stats_job:{stats.job_id}")
+            for stats in history[i:i + 5]
+        ])
+    inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=back)])
+    return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+
+def get_dead_letters_keyboard(jobs: List[Tuple[int, int]]) -> InlineKeyboardMarkup:
+    """Повторная отправка недоставленных сообщений по заданиям"""
+    inline_keyboard = [
+        [InlineKeyboardButton(text=f"🔁 Рассылка #{job_id}: {count}", callback_data=f"redrive:{job_id}")]
+        for job_id, count in jobs
+    ]
+    inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="main_menu")])
+    return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+
+def get_broadcast_control_keyboard(job_id: int, paused: bool) -> InlineKeyboardMarkup:
+    """Управление идущей рассылкой"""
+    if paused:
+        toggle = InlineKeyboardButton(text="▶️ Продолжить", callback_data=f"bc_resume:{job_id}")
+    else:
+        toggle = InlineKeyboardButton(text="⏸ Пауза", callback_data=f"bc_pause:{job_id}")
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [toggle, InlineKeyboardButton(text="⛔ Остановить", callback_data=f"bc_cancel:{job_id}")]
+    ])
+    return keyboard
+
+def get_tags_keyboard(tags: List[Tag]) -> InlineKeyboardMarkup:
+    """Удаление тегов"""
+    inline_keyboard = [
+        [InlineKeyboardButton(text=f"🗑 {tag.name} ({tag.users})", callback_data=f"del_tag:{tag.id}")]
+        for tag in tags
+    ]
+    inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="manage_users")])
+    return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+
+def get_broadcast_preview_keyboard() -> InlineKeyboardMarkup:
+    """Подтверждение рассылки с выбором аудитории"""
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🎯 Выбрать аудиторию", callback_data="segment")],
+        [InlineKeyboardButton(text="🕒 Запланировать", callback_data="schedule")],
+        [
+            InlineKeyboardButton(text="✅ Да", callback_data="confirm_broadcast"),
             InlineKeyboardButton(text="❌ Нет", callback_data="main_menu")
         ]
     ])
     return keyboard
 
+def get_segment_keyboard(segment: dict, tags: List[Tag]) -> InlineKeyboardMarkup:
+    """Конструктор сегмента: теги, дата добавления, получение прошлой рассылки"""
+    def mark(selected: bool) -> str:
+        return "✅" if selected else "▫️"
+
+    inline_keyboard = [
+        [InlineKeyboardButton(text=f"{mark(tag.id in segment['tags'])} {tag.name} ({tag.users})",
+                              callback_data=f"seg:tag:{tag.id}")]
+        for tag in tags
+    ]
+    if len(segment["tags"]) > 1:
+        mode = "все выбранные теги" if segment["match_all"] else "любой из тегов"
+        inline_keyboard.append([InlineKeyboardButton(text=f"🔀 Нужен {mode}", callback_data="seg:all")])
+
+    inline_keyboard.append([
+        InlineKeyboardButton(text=f"{mark(segment['added_days'] == days)} {title}", callback_data=f"seg:added:{days}")
+        for days, title in ((7, "За 7 дней"), (30, "За 30 дней"), (-30, "Старше 30 дней"))
+    ])
+    inline_keyboard.append([InlineKeyboardButton(
+        text=f"{mark(segment['not_received_last'])} Не получили прошлую рассылку", callback_data="seg:unreceived"
+    )])
+    inline_keyboard.append([
+        InlineKeyboardButton(text="🔄 Сбросить", callback_data="seg:reset"),
+        InlineKeyboardButton(text="✔️ Готово", callback_data="broadcast")
+    ])
+    return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+
+def get_scheduled_keyboard(items: List[ScheduledBroadcast]) -> InlineKeyboardMarkup:
+    """Отмена запланированных рассылок"""
+    inline_keyboard = [
+        [InlineKeyboardButton(text=f"❌ Отменить #{item.id} ({item.run_at.strftime('%d.%m %H:%M')})",
+                              callback_data=f"sched_cancel:{item.id}")]
+        for item in items
+    ]
+    inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="main_menu")])
+    return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+
 def get_back_keyboard() -> InlineKeyboardMarkup:
     """Кнопка назад"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -1,11 +1,15 @@
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 
 from config.settings import settings
-from database.database import Database
+from database.fsm_storage import SQLiteStorage
 from handlers import admin, common
+from middlewares.metrics import HandlerTimingMiddleware
+from middlewares.throttling import ThrottlingMiddleware
+from services.broadcast import resume_unfinished_jobs
+from services.metrics import start_metrics_server
+from services.webhook import run_webhook
 
 # Настройка логирования
 logging.basicConfig(
@@ -19,25 +23,56 @@ async def main():
     """Главная функция запуска бота"""
     # Инициализация бота и диспетчера
     bot = Bot(token=settings.BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
 
-    # Инициализация базы данных
-    db = Database(settings.DATABASE_URL)
+    # Инициализация базы данных (соединения общие с обработчиками)
+    db = admin.db
     await db.init_db()
 
+    # Состояния FSM хранятся в базе и переживают перезапуск
+    dp = Dispatcher(storage=SQLiteStorage(db, settings.FSM_CACHE_SIZE))
+
+    # Защита от флуда до FSM: лишние обновления не читают состояние и не вызывают обработчики
+    dp.update.outer_middleware.unregister(dp.fsm)
+    dp.update.outer_middleware(ThrottlingMiddleware(
+        settings.ADMIN_ID, settings.THROTTLE_LIMIT, settings.THROTTLE_WINDOW, settings.THROTTLE_CACHE_SIZE
+    ))
+    dp.update.outer_middleware(dp.fsm)
+
+    # Замер времени обработчиков
+    timing = HandlerTimingMiddleware()
+    dp.message.middleware(timing)
+    dp.callback_query.middleware(timing)
+
     # Регистрация роутеров
     dp.include_router(common.router)
     dp.include_router(admin.router)
 
+    metrics_server = await start_metrics_server(settings.METRICS_HOST, settings.METRICS_PORT)
+
+    # Продолжение рассылок, прерванных перезапуском
+    resumed_jobs = await resume_unfinished_jobs(bot, db)
+    await admin.scheduler.start(bot)
+
     logger.info("Бот запущен")
     # await bot.send_message(settings.ADMIN_ID, "🤖 Бот запущен!")
 
     try:
-        await dp.start_polling(bot)
+        if settings.BOT_MODE == "webhook":
+            await run_webhook(bot, dp)
+        else:
+            await dp.start_polling(bot)
     except KeyboardInterrupt:
         # await bot.send_message(settings.ADMIN_ID, "🔴 Бот остановлен!")
         logger.info("Бот остановлен")
     finally:
+        await admin.scheduler.stop()
+        await admin.stop_background_tasks()
+        for task in resumed_jobs:
+            task.cancel()
+        await asyncio.gather(*resumed_jobs, return_exceptions=True)
+        if metrics_server:
+            await metrics_server.cleanup()
+        await db.close()
         await bot.session.close()
 
 
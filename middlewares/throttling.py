@@ -0,0 +1,58 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User
+
+from database.cache import MISSING, LRUCache
+from services.metrics import throttled_updates
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Отбрасывание частых обновлений от не-админов до роутеров и хранилища FSM
+
+    Для каждого пользователя хранится скользящее окно из двух интервалов
+    (номер интервала, счетчик текущего, счетчик предыдущего), поэтому память
+    на пользователя постоянна, а число пользователей ограничено LRU-кэшем.
+    """
+
+    def __init__(self, admin_id: int, limit: int, window: float, max_users: int):
+        self.admin_id = admin_id
+        self.limit = limit
+        self.window = window
+        self._counters = LRUCache(max_users)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user: User = data.get("event_from_user")
+        if user is None or user.id == self.admin_id or self._allow(user.id):
+            return await handler(event, data)
+
+        # Ответ не отправляется: каждый ответ тратил бы лимит Bot API
+        throttled_updates.inc()
+        return None
+
+    def _allow(self, user_id: int) -> bool:
+        position = time.monotonic() / self.window
+        interval = int(position)
+
+        counter = self._counters.get(user_id)
+        if counter is MISSING:
+            self._counters.set(user_id, [interval, 1, 0])
+            return True
+
+        if counter[0] != interval:
+            # Предыдущий интервал учитывается, только если он соседний
+            counter[2] = counter[1] if counter[0] == interval - 1 else 0
+            counter[0], counter[1] = interval, 0
+
+        # Доля предыдущего интервала, еще попадающая в окно
+        estimate = counter[2] * (1 - (position - interval)) + counter[1]
+        if estimate >= self.limit:
+            return False
+        counter[1] += 1
+        return True
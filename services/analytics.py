@@ -0,0 +1,34 @@
+import time
+from typing import Dict
+
+from database.database import Database
+
+
+class DeliveryStats:
+    """Поминутный подсчет результатов отправки в памяти
+
+    В базу уходит одна строка на минуту рассылки вместо чтения статусов
+    всех доставок при построении статистики.
+    """
+
+    def __init__(self, db: Database, job_id: int):
+        self.db = db
+        self.job_id = job_id
+        self._minute = 0
+        self._counts: Dict[str, int] = {}
+
+    async def record(self, status: str):
+        minute = int(time.time() // 60)
+        if minute != self._minute:
+            await self.flush()
+            self._minute = minute
+        self._counts[status] = self._counts.get(status, 0) + 1
+
+    async def flush(self):
+        """Передача итогов текущей минуты в отложенную запись"""
+        if self._counts:
+            await self.db.defer_minute_stats(
+                self.job_id, self._minute,
+                self._counts.get("sent", 0), self._counts.get("blocked", 0), self._counts.get("failed", 0)
+            )
+            self._counts = {}
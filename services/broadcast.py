@@ -0,0 +1,356 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import AsyncIterable, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Set, Union
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+)
+
+from config.settings import settings
+from database.database import MAX_ID, Database
+from database.models import BroadcastJob
+from services.analytics import DeliveryStats
+from services.content import build_sender
+from services.metrics import broadcast_in_flight, broadcast_messages, broadcast_rate, broadcast_retries
+
+logger = logging.getLogger(__name__)
+
+# Получатель - id чата или кортеж (id, значения переменных шаблона)
+Recipient = Union[int, tuple]
+
+# Рассылки, идущие в текущем процессе, по id задания
+active_broadcasts: Dict[int, "Broadcaster"] = {}
+
+# Ошибки, после которых отправку имеет смысл повторить
+TRANSIENT_ERRORS = (TelegramServerError, TelegramNetworkError, asyncio.TimeoutError)
+
+
+class TokenBucket:
+    """Глобальный ограничитель скорости отправки"""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, stop: Optional[asyncio.Event] = None) -> bool:
+        """Ожидание свободного токена; False, если раньше наступило событие stop"""
+        async with self._lock:
+            while True:
+                if stop is not None and stop.is_set():
+                    return False
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+
+                delay = (1 - self._tokens) / self.rate
+                if stop is None:
+                    await asyncio.sleep(delay)
+                    continue
+                # При медленном темпе ожидание токена длится долго - прерываем его остановкой
+                try:
+                    await asyncio.wait_for(stop.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    def drain(self):
+        """Сброс накопленных токенов (после RetryAfter)"""
+        self._tokens = 0
+        self._updated = time.monotonic()
+
+
+@dataclass
+class BroadcastResult:
+    sent: int = 0
+    blocked: int = 0
+    failed: int = 0
+    duration: float = 0.0
+    cancelled: bool = False
+
+    @property
+    def processed(self) -> int:
+        """Получателей с окончательным результатом отправки"""
+        return self.sent + self.blocked + self.failed
+
+    @property
+    def rate(self) -> float:
+        """Скорость отправки, сообщений в секунду"""
+        return self.sent / self.duration if self.duration else 0.0
+
+
+class Broadcaster:
+    """Конкурентная рассылка с глобальным ограничением скорости"""
+
+    def __init__(self, concurrency: int, rate_limit: float,
+                 on_blocked: Optional[Callable[[int], Awaitable]] = None,
+                 on_result: Optional[Callable[[int, str], Awaitable]] = None,
+                 on_failed: Optional[Callable[[int, str], Awaitable]] = None,
+                 max_retries: int = 0, retry_base: float = 1, retry_max: float = 60):
+        self.concurrency = max(1, concurrency)
+        self.bucket = TokenBucket(rate_limit)
+        self.on_blocked = on_blocked
+        self.on_result = on_result
+        self.on_failed = on_failed
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.result = BroadcastResult()
+        self._retries: Set[asyncio.Task] = set()
+        self._started = time.monotonic()
+        self._resume = asyncio.Event()
+        self._resume.set()
+        self._unpaused = asyncio.Event()
+        self._unpaused.set()
+        self._stopped = asyncio.Event()
+
+    @property
+    def paused(self) -> bool:
+        return not self._unpaused.is_set()
+
+    def pause(self):
+        """Приостановка рассылки админом"""
+        self._unpaused.clear()
+
+    def resume(self):
+        """Продолжение рассылки после паузы"""
+        self._unpaused.set()
+
+    def cancel(self):
+        """Остановка рассылки; неотправленные получатели остаются в очереди задания"""
+        self.result.cancelled = True
+        self._unpaused.set()
+        self._stopped.set()
+
+    async def run(self, recipients: Union[Iterable[Recipient], AsyncIterable[Recipient]],
+                  send: Callable[[Recipient], Awaitable]) -> BroadcastResult:
+        """Отправка всем получателям, не более concurrency запросов одновременно"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        started = self._started = time.monotonic()
+        workers = [asyncio.create_task(self._worker(queue, send)) for _ in range(self.concurrency)]
+
+        try:
+            if isinstance(recipients, AsyncIterable):
+                async for recipient in recipients:
+                    if self.result.cancelled:
+                        break
+                    await queue.put(recipient)
+            else:
+                for recipient in recipients:
+                    if self.result.cancelled:
+                        break
+                    await queue.put(recipient)
+
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+
+            # Отложенные повторы могут запланировать новые
+            while self._retries:
+                await asyncio.gather(*self._retries)
+        finally:
+            for task in workers + list(self._retries):
+                task.cancel()
+            self.result.duration = time.monotonic() - started
+            broadcast_rate.set(0)
+
+        logger.info(
+            f"Рассылка завершена за {self.result.duration:.1f} с: "
+            f"отправлено {self.result.sent}, заблокировали {self.result.blocked}, "
+            f"ошибок {self.result.failed} ({self.result.rate:.1f} сообщ./с)"
+        )
+        return self.result
+
+    async def _worker(self, queue: asyncio.Queue, send: Callable[[Recipient], Awaitable]):
+        while True:
+            recipient = await queue.get()
+            if recipient is None:
+                return
+            await self._deliver(recipient, send)
+
+    async def _deliver(self, recipient: Recipient, send: Callable[[Recipient], Awaitable], attempt: int = 0):
+        chat_id = recipient[0] if isinstance(recipient, tuple) else recipient
+        while True:
+            await self._unpaused.wait()
+            await self._resume.wait()
+            if self.result.cancelled:
+                return
+            if not await self.bucket.acquire(self._stopped):
+                return
+            if self.paused or self.result.cancelled:
+                # Пауза или остановка, пока ждали своей очереди в ограничителе
+                continue
+            try:
+                await self._send(send, recipient)
+            except TelegramRetryAfter as e:
+                broadcast_retries.inc()
+                await self._pause(e.retry_after)
+                continue
+            except TelegramForbiddenError:
+                status = "blocked"
+                self.result.blocked += 1
+                logger.info(f"Пользователь {chat_id} заблокировал бота")
+                if self.on_blocked:
+                    await self.on_blocked(chat_id)
+            except TRANSIENT_ERRORS as e:
+                if attempt < self.max_retries:
+                    broadcast_retries.inc()
+                    self._schedule_retry(recipient, send, attempt + 1)
+                    return
+                status = "failed"
+                await self._fail(chat_id, f"{type(e).__name__}: {e}")
+            except Exception as e:
+                status = "failed"
+                await self._fail(chat_id, f"{type(e).__name__}: {e}")
+            else:
+                status = "sent"
+                self.result.sent += 1
+                broadcast_rate.set(self.result.sent / (time.monotonic() - self._started))
+
+            broadcast_messages.inc(status=status)
+            if self.on_result:
+                await self.on_result(chat_id, status)
+            return
+
+    def _schedule_retry(self, recipient: Recipient, send: Callable[[Recipient], Awaitable], attempt: int):
+        """Повтор отправки через экспоненциально растущую задержку, не занимая обработчик очереди"""
+        delay = min(self.retry_max, self.retry_base * 2 ** (attempt - 1))
+        # Разброс, чтобы повторы после общего сбоя не приходили одной волной
+        delay = random.uniform(delay / 2, delay)
+        logger.debug(f"Повтор отправки получателю {recipient} через {delay:.1f} с (попытка {attempt})")
+
+        task = asyncio.create_task(self._retry_later(recipient, send, attempt, delay))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _retry_later(self, recipient: Recipient, send: Callable[[Recipient], Awaitable], attempt: int,
+                           delay: float):
+        await asyncio.sleep(delay)
+        await self._deliver(recipient, send, attempt)
+
+    async def _fail(self, chat_id: int, error: str):
+        self.result.failed += 1
+        logger.error(f"Не удалось отправить сообщение пользователю {chat_id}: {error}")
+        if self.on_failed:
+            await self.on_failed(chat_id, error)
+
+    @staticmethod
+    async def _send(send: Callable[[Recipient], Awaitable], recipient: Recipient):
+        broadcast_in_flight.inc()
+        try:
+            await send(recipient)
+        finally:
+            broadcast_in_flight.dec()
+
+    async def _pause(self, delay: float):
+        """Приостановка всех отправок на время, указанное Telegram"""
+        if not self._resume.is_set():
+            return
+
+        logger.warning(f"Превышен лимит Telegram, пауза {delay} с")
+        self._resume.clear()
+        self.bucket.drain()
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self._resume.set()
+
+
+async def send_job(bot: Bot, db: Database, job: BroadcastJob, after_id: int = 0, until_id: int = MAX_ID,
+                   share: int = 1, rate_limit: Optional[float] = None,
+                   user_ids: Optional[Sequence[int]] = None) -> BroadcastResult:
+    """Отправка сообщения задания получателям из диапазона id, которым оно еще не доставлено
+
+    share - число процессов, между которыми делится глобальный лимит скорости.
+    rate_limit - более низкий темп отправки (для растянутых рассылок), сообщений в секунду.
+    user_ids - отправка только этим получателям (повторная отправка недоставленных) вместо диапазона.
+    """
+    stats = DeliveryStats(db, job.id)
+
+    async def on_result(chat_id: int, status: str):
+        await db.defer_delivery(job.id, chat_id, status)
+        await stats.record(status)
+
+    rate_limit = min(rate_limit or settings.BROADCAST_RATE_LIMIT, settings.BROADCAST_RATE_LIMIT)
+    broadcaster = Broadcaster(
+        concurrency=settings.BROADCAST_CONCURRENCY // share,
+        rate_limit=rate_limit / share,
+        on_blocked=db.defer_delete_user,
+        on_result=on_result,
+        on_failed=lambda chat_id, error: db.defer_dead_letter(job.id, chat_id, error),
+        max_retries=settings.BROADCAST_MAX_RETRIES,
+        retry_base=settings.BROADCAST_RETRY_BASE,
+        retry_max=settings.BROADCAST_RETRY_MAX
+    )
+
+    # Регистрация до первого await: отмена сразу после запуска задания уже найдет рассылку
+    active_broadcasts[job.id] = broadcaster
+    try:
+        message = await db.get_message(job.message_id)
+        fields = message.template_fields or ()
+        if user_ids is not None:
+            recipients = db.iter_requeued_deliveries(job.id, user_ids, fields=fields)
+        else:
+            recipients = db.iter_pending_deliveries(job.id, after_id=after_id, until_id=until_id, fields=fields)
+        return await broadcaster.run(recipients, build_sender(bot, message))
+    finally:
+        if active_broadcasts.get(job.id) is broadcaster:
+            del active_broadcasts[job.id]
+        # Сохраняем прогресс даже при остановке бота посреди рассылки
+        await stats.flush()
+        await db.flush_writes()
+        # Диапазоны воркеров идут параллельно, поэтому их время делится на число воркеров
+        result = broadcaster.result
+        await db.record_broadcast_run(
+            job.id, result.sent, result.blocked, result.failed, result.duration / share,
+            requeued=len(user_ids) if user_ids is not None else 0
+        )
+
+
+async def run_broadcast_job(bot: Bot, db: Database, job: BroadcastJob, rate_limit: Optional[float] = None,
+                            user_ids: Optional[Sequence[int]] = None) -> BroadcastResult:
+    """Отправка сообщения задания всем получателям (или только user_ids) в текущем процессе"""
+    result = await send_job(bot, db, job, rate_limit=rate_limit, user_ids=user_ids)
+    # Повторная отправка по остановленной рассылке не делает ее завершенной
+    cancelled = result.cancelled or job.status == "cancelled"
+    await db.finish_broadcast_job(job.id, "cancelled" if cancelled else "done")
+    return result
+
+
+async def report_job(bot: Bot, db: Database, job_id: int, title: str):
+    """Отправка админу итогов задания по сохраненным статусам доставки"""
+    counts = await db.get_job_counts(job_id)
+    text = f"{title}\n\n"
+    text += f"📤 Отправлено: {counts.get('sent', 0)}\n"
+    if counts.get("blocked"):
+        text += f"🚫 Заблокировали бота: {counts['blocked']}\n"
+    if counts.get("failed"):
+        text += f"⚠️ Ошибок: {counts['failed']}"
+
+    try:
+        await bot.send_message(settings.ADMIN_ID, text)
+    except Exception as e:
+        logger.error(f"Не удалось отправить отчет о рассылке {job_id}: {e}")
+
+
+async def resume_broadcast_job(bot: Bot, db: Database, job: BroadcastJob):
+    """Продолжение прерванной рассылки с последней контрольной точки"""
+    logger.info(f"Возобновление рассылки {job.id}")
+    await run_broadcast_job(bot, db, job)
+    await report_job(bot, db, job.id, f"✅ Прерванная рассылка #{job.id} завершена!")
+
+
+async def resume_unfinished_jobs(bot: Bot, db: Database) -> List[asyncio.Task]:
+    """Запуск всех прерванных рассылок в фоне"""
+    return [
+        asyncio.create_task(resume_broadcast_job(bot, db, job))
+        for job in await db.get_unfinished_jobs()
+    ]
@@ -0,0 +1,165 @@
+from typing import Awaitable, Callable, List, Optional, Tuple, Union
+
+from aiogram import Bot
+from aiogram.types import (
+    InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo, Message as TelegramMessage,
+    MessageEntity
+)
+
+from database.models import Message
+from services.templates import compile_template
+
+# Медиа, которые отправляются повторно по file_id вместе с подписью
+CAPTIONED_MEDIA = ("photo", "video", "animation", "document", "audio", "voice")
+
+ALBUM_MEDIA = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+    "audio": InputMediaAudio,
+}
+
+CONTENT_LABELS = {
+    "text": "💬 Текст",
+    "photo": "🖼 Фото",
+    "video": "🎬 Видео",
+    "animation": "🎞 GIF",
+    "document": "📎 Документ",
+    "audio": "🎵 Аудио",
+    "voice": "🎤 Голосовое",
+    "album": "🗂 Альбом",
+    "sticker": "🌟 Стикер",
+}
+
+
+def _file_id(message: TelegramMessage, content_type: str) -> str:
+    if content_type == "photo":
+        # Самый большой из размеров
+        return message.photo[-1].file_id
+    return getattr(message, content_type).file_id
+
+
+def _dump_entities(entities: Optional[List[MessageEntity]]) -> List[dict]:
+    return [entity.model_dump(exclude_none=True) for entity in entities or []]
+
+
+def _load_entities(entities: List[dict]) -> Optional[List[MessageEntity]]:
+    return [MessageEntity(**entity) for entity in entities] or None
+
+
+def _content_type(message: TelegramMessage) -> str:
+    """Тип сообщения обычной строкой: aiogram возвращает перечисление ContentType"""
+    return message.content_type.value
+
+
+def _split_recipient(recipient: Union[int, tuple]) -> Tuple[int, tuple]:
+    """id чата и значения переменных шаблона получателя"""
+    if isinstance(recipient, tuple):
+        return recipient[0], recipient[1:]
+    return recipient, ()
+
+
+def extract_content(messages: List[TelegramMessage]) -> dict:
+    """Параметры Database.save_message для сообщения админа (или всех сообщений альбома)
+
+    Текст и подпись проверяются как шаблон, неизвестная переменная - ValueError.
+    """
+    first = messages[0]
+    content = {
+        "source_chat_id": first.chat.id,
+        "source_message_id": first.message_id,
+    }
+
+    if len(messages) > 1:
+        # В альбоме подпись обычно только у одного элемента
+        captioned = next((message for message in messages if message.caption), first)
+        content.update(
+            text=captioned.caption or "",
+            content_type="album",
+            media=[
+                {
+                    "type": _content_type(message),
+                    "file_id": _file_id(message, _content_type(message)),
+                    "caption": message.caption,
+                    "caption_entities": _dump_entities(message.caption_entities),
+                }
+                for message in messages
+            ]
+        )
+    elif first.text is not None:
+        content.update(text=first.text, content_type="text", entities=_dump_entities(first.entities))
+    elif _content_type(first) in CAPTIONED_MEDIA:
+        content_type = _content_type(first)
+        content.update(
+            text=first.caption or "",
+            content_type=content_type,
+            entities=_dump_entities(first.caption_entities),
+            media=[{"type": content_type, "file_id": _file_id(first, content_type)}]
+        )
+    else:
+        # Стикеры, опросы, геопозиции и прочее отправляются копией исходного сообщения
+        content.update(text="", content_type=_content_type(first))
+
+    if content["content_type"] == "text" or content["content_type"] in CAPTIONED_MEDIA:
+        template = compile_template(content["text"], content.get("entities"))
+        content["template_fields"] = template.fields if template else None
+    return content
+
+
+def describe_content(message: Message) -> str:
+    """Краткое описание сообщения для предпросмотра"""
+    label = CONTENT_LABELS.get(message.content_type, f"📦 {message.content_type}")
+    if message.content_type == "album":
+        label += f" ({len(message.media)} шт.)"
+    if message.content_type == "text":
+        return message.text
+    return f"{label}\n{message.text}" if message.text else label
+
+
+def build_sender(bot: Bot, message: Message) -> Callable[[int], Awaitable]:
+    """Функция отправки сообщения рассылки одному получателю
+
+    Файлы уже загружены в Telegram, поэтому каждому получателю уходит только file_id,
+    а объекты форматирования, медиа и шаблон собираются один раз на всю рассылку.
+    Получатель - id чата или кортеж (id, значения переменных шаблона).
+    """
+    template = None
+    if message.template_fields is not None:
+        template = compile_template(message.text, message.entities)
+
+    if message.content_type == "text":
+        if template:
+            def send_text(recipient):
+                chat_id, values = _split_recipient(recipient)
+                text, entities = template.render(values)
+                return bot.send_message(chat_id, text, entities=entities)
+            return send_text
+
+        entities = _load_entities(message.entities)
+        return lambda chat_id: bot.send_message(chat_id, message.text, entities=entities)
+
+    if message.content_type in CAPTIONED_MEDIA:
+        send = getattr(bot, f"send_{message.content_type}")
+        file = {message.content_type: message.media[0]["file_id"]}
+        if template:
+            def send_media(recipient):
+                chat_id, values = _split_recipient(recipient)
+                caption, caption_entities = template.render(values)
+                return send(chat_id, caption=caption, caption_entities=caption_entities, **file)
+            return send_media
+
+        caption_entities = _load_entities(message.entities)
+        return lambda chat_id: send(chat_id, caption=message.text or None, caption_entities=caption_entities, **file)
+
+    if message.content_type == "album":
+        media = [
+            ALBUM_MEDIA[item["type"]](
+                media=item["file_id"],
+                caption=item["caption"],
+                caption_entities=_load_entities(item["caption_entities"])
+            )
+            for item in message.media
+        ]
+        return lambda chat_id: bot.send_media_group(chat_id, media)
+
+    return lambda chat_id: bot.copy_message(chat_id, message.source_chat_id, message.source_message_id)
@@ -0,0 +1,51 @@
+import csv
+import gzip
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+from typing import Tuple
+
+from config.settings import settings
+from database.database import Database
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("csv", "jsonl")
+EXPORT_FIELDS = ("id", "username", "first_name", "added_date")
+
+
+async def export_users(db: Database, fmt: str) -> Tuple[str, str, int]:
+    """Потоковая выгрузка активных пользователей во временный файл: (путь, имя файла, количество)"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат экспорта: {fmt}")
+
+    # Большие выгрузки сжимаем, чтобы уложиться в лимит размера документа
+    compress = await db.count_users() > settings.EXPORT_GZIP_THRESHOLD
+    filename = f"users_{datetime.now().strftime('%Y%m%d_%H%M')}.{fmt}" + (".gz" if compress else "")
+
+    fd, path = tempfile.mkstemp(suffix=f"_{filename}")
+    os.close(fd)
+
+    count = 0
+    opener = gzip.open if compress else open
+    try:
+        with opener(path, "wt", encoding="utf-8", newline="") as file:
+            writer = csv.writer(file) if fmt == "csv" else None
+            if writer:
+                writer.writerow(EXPORT_FIELDS)
+
+            async for user in db.iter_users():
+                row = (user.id, user.username or "", user.first_name, user.added_date.isoformat())
+                if writer:
+                    writer.writerow(row)
+                else:
+                    file.write(json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + "\n")
+                count += 1
+    except Exception:
+        os.remove(path)
+        raise
+
+    logger.info(f"Выгружено {count} пользователей в {filename}")
+    return path, filename, count
@@ -0,0 +1,106 @@
+import asyncio
+import csv
+import logging
+import re
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from aiogram import Bot
+
+from config.settings import settings
+from database.database import Database
+from services.resolver import ChatResolver
+
+logger = logging.getLogger(__name__)
+
+USERNAME_RE = re.compile(r"^@?([A-Za-z][A-Za-z0-9_]{3,31})$")
+
+
+@dataclass
+class ImportResult:
+    processed: int = 0
+    added: int = 0
+    not_found: int = 0
+    invalid: int = 0
+
+
+class UserImporter:
+    """Импорт подписчиков из файла: строки с id или @username (и необязательным именем)"""
+
+    def __init__(self, bot: Bot, db: Database, resolver: ChatResolver,
+                 on_progress: Optional[Callable[[ImportResult], Awaitable]] = None):
+        self.bot = bot
+        self.db = db
+        self.resolver = resolver
+        self.on_progress = on_progress
+        self.result = ImportResult()
+        self._semaphore = asyncio.Semaphore(settings.IMPORT_CONCURRENCY)
+        self._batch: Dict[int, Tuple[int, Optional[str], str]] = {}
+        self._usernames: Dict[str, int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def run(self, path: str) -> ImportResult:
+        """Потоковый разбор файла с параллельным поиском username"""
+        with open(path, encoding="utf-8-sig", errors="replace", newline="") as file:
+            for row in csv.reader(file):
+                await self._process_row([cell.strip() for cell in row if cell.strip()])
+                self.result.processed += 1
+
+                if len(self._batch) >= settings.IMPORT_BATCH_SIZE:
+                    await self._flush()
+                if self.on_progress and self.result.processed % 100 == 0:
+                    await self.on_progress(self.result)
+
+        await asyncio.gather(*self._tasks)
+        await self._flush()
+        return self.result
+
+    async def _process_row(self, cells: list):
+        if not cells or cells[0].startswith("#"):
+            return
+
+        value, first_name = cells[0], cells[1] if len(cells) > 1 else None
+        if value.lstrip("-").isdigit():
+            user_id = int(value)
+            self._add(user_id, None, first_name or None)
+            return
+
+        match = USERNAME_RE.match(value)
+        if not match:
+            self.result.invalid += 1
+            return
+
+        # Ограничиваем число одновременных запросов, не дожидаясь каждого ответа
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._resolve(match.group(1)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _resolve(self, username: str):
+        try:
+            chat = await self.resolver.resolve(self.bot, username)
+        except Exception as e:
+            logger.error(f"Ошибка поиска пользователя @{username}: {e}")
+            chat = None
+        finally:
+            self._semaphore.release()
+
+        if chat is None:
+            self.result.not_found += 1
+        else:
+            self._add(chat.chat_id, chat.username, chat.first_name or chat.username)
+
+    def _add(self, user_id: int, username: Optional[str], first_name: Optional[str]):
+        if username:
+            # В одном пакете username должен остаться уникальным
+            key = username.lower()
+            other = self._batch.get(self._usernames.get(key))
+            if other and other[0] != user_id and other[1] and other[1].lower() == key:
+                self._batch[other[0]] = (other[0], None, other[2])
+            self._usernames[key] = user_id
+        self._batch[user_id] = (user_id, username, first_name)
+
+    async def _flush(self):
+        batch, self._batch, self._usernames = list(self._batch.values()), {}, {}
+        if batch:
+            self.result.added += await self.db.add_users(batch)
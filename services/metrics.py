@@ -0,0 +1,200 @@
+import inspect
+import logging
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+class Metric:
+    """Базовая метрика с метками в формате Prometheus"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _format_labels(self, key: LabelValues, extra: str = "") -> str:
+        pairs = [f'{label}="{value}"' for label, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        return super().render() + [
+            f"{self.name}{self._format_labels(key)} {value}" for key, value in self.values.items()
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        # По меткам: количество в каждом интервале (последний - +Inf), сумма, общее количество
+        self.series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = ([0] * (len(self.buckets) + 1), [0.0, 0])
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+        series[1][1] += 1
+
+    def summary(self) -> List[Tuple[LabelValues, int, float, float]]:
+        """(метки, количество, среднее, оценка p99 по границам интервалов) для каждой серии"""
+        result = []
+        for key, (counts, (total, count)) in self.series.items():
+            result.append((key, count, total / count if count else 0.0, self._quantile(counts, count, 0.99)))
+        return result
+
+    def _quantile(self, counts: List[int], count: int, q: float) -> float:
+        threshold = q * count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            if cumulative >= threshold:
+                return bound
+        return float("inf")
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for key, (counts, (total, count)) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = self._format_labels(key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+REGISTRY: List[Metric] = []
+
+handler_latency = Histogram("bot_handler_duration_seconds", "Время работы обработчиков", ("handler",))
+db_latency = Histogram("bot_db_query_duration_seconds", "Время выполнения методов Database", ("method",))
+broadcast_messages = Counter("bot_broadcast_messages_total", "Результаты отправки рассылки", ("status",))
+broadcast_retries = Counter("bot_broadcast_retries_total", "Повторные попытки отправки")
+broadcast_in_flight = Gauge("bot_broadcast_in_flight", "Отправок в процессе")
+broadcast_rate = Gauge("bot_broadcast_rate", "Текущая скорость рассылки, сообщений в секунду")
+throttled_updates = Counter("bot_throttled_updates_total", "Отброшенные обновления от не-админов")
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def instrument(histogram: Histogram, label: str = "method"):
+    """Декоратор класса: замер времени всех публичных асинхронных методов"""
+
+    def wrap_coroutine(func, name):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, **{label: name})
+        return wrapper
+
+    def wrap_generator(func, name):
+        # Учитывается только время внутри генератора, без обработки элементов вызывающим кодом
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            generator = func(*args, **kwargs)
+            spent = 0.0
+            try:
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        item = await generator.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        spent += time.perf_counter() - started
+                    yield item
+            finally:
+                await generator.aclose()
+                histogram.observe(spent, **{label: name})
+        return wrapper
+
+    def decorator(cls):
+        for name, func in list(vars(cls).items()):
+            if name.startswith("_"):
+                continue
+            if inspect.iscoroutinefunction(func):
+                setattr(cls, name, wrap_coroutine(func, name))
+            elif inspect.isasyncgenfunction(func):
+                setattr(cls, name, wrap_generator(func, name))
+        return cls
+
+    return decorator
+
+
+async def start_metrics_server(host: str, port: int) -> Optional[web.AppRunner]:
+    """HTTP-эндпоинт /metrics для Prometheus (port=0 - выключен)"""
+    if not port:
+        return None
+
+    async def metrics_handler(request: web.Request) -> web.Response:
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
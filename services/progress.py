@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import Message
+
+from services.broadcast import active_broadcasts
+from keyboards.admin_kb import get_broadcast_control_keyboard
+
+logger = logging.getLogger(__name__)
+
+
+def format_duration(seconds: float) -> str:
+    """Длительность в виде 1 ч 05 мин / 3 мин 20 с / 15 с"""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600} ч {seconds % 3600 // 60:02d} мин"
+    if seconds >= 60:
+        return f"{seconds // 60} мин {seconds % 60:02d} с"
+    return f"{seconds} с"
+
+
+class BroadcastProgress:
+    """Периодическое обновление сообщения о ходе рассылки
+
+    Сообщение редактируется из отдельной задачи не чаще раза в interval секунд
+    и только при изменении текста, поэтому отправка не ждет правок и не делит
+    с ними лимит скорости.
+    """
+
+    def __init__(self, message: Message, job_id: int, total: int, interval: float):
+        self.message = message
+        self.job_id = job_id
+        self.total = total
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._text = ""
+        self._rate = 0.0
+        self._last = (time.monotonic(), 0)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            broadcaster = active_broadcasts.get(self.job_id)
+            if broadcaster is None:
+                continue
+
+            text = self._render(broadcaster)
+            if text == self._text:
+                continue
+            # После остановки кнопки управления уже убраны и не возвращаются
+            keyboard = None
+            if not broadcaster.result.cancelled:
+                keyboard = get_broadcast_control_keyboard(self.job_id, broadcaster.paused)
+            try:
+                await self.message.edit_text(text, reply_markup=keyboard)
+                self._text = text
+            except TelegramAPIError as e:
+                logger.debug(f"Не удалось обновить прогресс рассылки {self.job_id}: {e}")
+
+    def _render(self, broadcaster) -> str:
+        result = broadcaster.result
+        now = time.monotonic()
+        last_time, last_processed = self._last
+        self._last = (now, result.processed)
+
+        # Скорость за последний интервал со сглаживанием, чтобы паузы и RetryAfter не искажали ETA
+        current = (result.processed - last_processed) / (now - last_time)
+        self._rate = current if not self._rate else 0.5 * self._rate + 0.5 * current
+
+        if result.cancelled:
+            text = "⛔ Рассылка останавливается...\n\n"
+        elif broadcaster.paused:
+            text = "⏸ Рассылка на паузе\n\n"
+        else:
+            text = "📤 Идет рассылка...\n\n"
+        text += f"Обработано: {result.processed} из {self.total}\n"
+        text += f"📤 Отправлено: {result.sent}\n"
+        if result.blocked:
+            text += f"🚫 Заблокировали бота: {result.blocked}\n"
+        if result.failed:
+            text += f"⚠️ Не доставлено: {result.failed}\n"
+
+        if not broadcaster.paused and not result.cancelled and self._rate >= 0.1:
+            remaining = max(0, self.total - result.processed)
+            text += f"\n⚡ {self._rate:.1f} сообщ./с, осталось ~{format_duration(remaining / self._rate)}"
+        return text
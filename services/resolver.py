@@ -0,0 +1,80 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from config.settings import settings
+from database.cache import MISSING, LRUCache
+from database.database import Database
+from database.models import ResolvedChat
+from services.broadcast import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class ChatResolver:
+    """Поиск chat id по username с кэшем в памяти (LRU) и в базе
+
+    Ненайденные username тоже кэшируются, но на меньшее время.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        self._memory = LRUCache(settings.RESOLVE_CACHE_SIZE)
+        self._bucket = TokenBucket(settings.RESOLVE_RATE_LIMIT)
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def _is_fresh(chat: ResolvedChat) -> bool:
+        ttl = settings.RESOLVE_CACHE_TTL if chat.chat_id is not None else settings.RESOLVE_NEGATIVE_TTL
+        return (datetime.now() - chat.resolved_at).total_seconds() < ttl
+
+    async def resolve(self, bot: Bot, username: str) -> Optional[ResolvedChat]:
+        """Информация о пользователе по username или None, если он не найден"""
+        key = username.lower()
+        cached = self._memory.get(key)
+        if cached is not MISSING and self._is_fresh(cached):
+            return cached if cached.chat_id is not None else None
+
+        # Одновременные запросы одного username разделяют один поход в Telegram
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._lookup(bot, username))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        chat = await asyncio.shield(task)
+        return chat if chat.chat_id is not None else None
+
+    async def remember(self, username: str, chat_id: int, first_name: Optional[str]):
+        """Сохранение уже известного соответствия (например, из пересланного сообщения)"""
+        await self._store(ResolvedChat(username, chat_id, first_name, datetime.now()))
+
+    async def _lookup(self, bot: Bot, username: str) -> ResolvedChat:
+        stored = await self.db.get_resolved_chat(username)
+        if stored and self._is_fresh(stored):
+            self._memory.set(username.lower(), stored)
+            return stored
+
+        while True:
+            await self._bucket.acquire()
+            try:
+                chat = await bot.get_chat(f"@{username}")
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except TelegramBadRequest:
+                resolved = ResolvedChat(username, None, None, datetime.now())
+            else:
+                resolved = ResolvedChat(chat.username or username, chat.id, chat.first_name, datetime.now())
+            break
+
+        await self._store(resolved)
+        return resolved
+
+    async def _store(self, chat: ResolvedChat):
+        self._memory.set(chat.username.lower(), chat)
+        await self.db.defer_resolved_chat(chat)
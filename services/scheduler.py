@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Optional, Set, Tuple
+
+from aiogram import Bot
+
+from config.settings import settings
+from database.database import Database
+from database.models import ScheduledBroadcast
+from services.broadcast import report_job, run_broadcast_job
+
+logger = logging.getLogger(__name__)
+
+
+def parse_schedule(text: str) -> Tuple[datetime, int]:
+    """Разбор "ДД.ММ[.ГГГГ] ЧЧ:ММ [часов]" или "сейчас [часов]" в (время начала, длительность в секундах)"""
+    tokens = text.lower().split()
+    if not tokens:
+        raise ValueError("пустое время")
+
+    now = datetime.now().replace(second=0, microsecond=0)
+    if tokens[0] == "сейчас":
+        run_at, rest = now, tokens[1:]
+    else:
+        if len(tokens) < 2:
+            raise ValueError("нет времени")
+        date_format = "%d.%m.%Y %H:%M" if tokens[0].count(".") == 2 else "%d.%m %H:%M"
+        run_at = datetime.strptime(f"{tokens[0]} {tokens[1]}", date_format)
+        if date_format == "%d.%m %H:%M":
+            run_at = run_at.replace(year=now.year)
+            if run_at < now:
+                run_at = run_at.replace(year=now.year + 1)
+        elif run_at < now:
+            # С явным годом прошедшая дата - опечатка, а не повод отправить сразу
+            raise ValueError("время уже прошло")
+        rest = tokens[2:]
+
+    hours = float(rest[0].replace(",", ".")) if rest else 0
+    if len(rest) > 1 or hours < 0:
+        raise ValueError("некорректная длительность")
+    return run_at, int(hours * 3600)
+
+
+class BroadcastScheduler:
+    """Запуск запланированных рассылок в назначенное время
+
+    Расписание хранится в базе, поэтому ожидающие рассылки переживают перезапуск,
+    а прерванные продолжаются с пересчитанным темпом.
+    """
+
+    def __init__(self, db: Database, interval: float):
+        self.db = db
+        self.interval = interval
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+
+    async def start(self, bot: Bot):
+        self._bot = bot
+        for item in await self.db.get_running_scheduled():
+            logger.info(f"Возобновление запланированной рассылки {item.id}")
+            self._spawn(item)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка; идущие рассылки продолжатся после перезапуска"""
+        tasks = list(self._running) + ([self._task] if self._task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def wake(self):
+        """Перепроверка расписания после добавления рассылки"""
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                for item in await self.db.claim_due_broadcasts():
+                    self._spawn(item)
+                next_run_at = await self.db.get_next_run_at()
+            except Exception as e:
+                logger.error(f"Ошибка планировщика рассылок: {e}")
+                next_run_at = None
+
+            delay = self.interval
+            if next_run_at:
+                delay = min(delay, max(0.0, next_run_at.timestamp() - time.time()))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _spawn(self, item: ScheduledBroadcast):
+        task = asyncio.create_task(self._execute(item))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _execute(self, item: ScheduledBroadcast):
+        try:
+            job = await self.db.get_job(item.job_id) if item.job_id else None
+            if job is None:
+                # Без растягивания большую рассылку забирают воркеры, если они есть
+                shards = settings.BROADCAST_SHARDS if settings.BROADCAST_WORKERS > 0 and not item.spread_seconds else 0
+                job = await self.db.create_broadcast_job(
+                    item.message_id, shards=shards, segment=item.segment, scheduled_id=item.id
+                )
+
+            rate_limit = await self._drip_rate(item, job.id)
+            # Админ мог отменить рассылку, пока создавалось задание: до появления задания
+            # в active_broadcasts остановить его можно только здесь
+            if await self.db.get_scheduled_status(item.id) == "cancelled":
+                await self.db.cancel_broadcast_job(job.id)
+                return
+
+            if job.status != "running":
+                # Задание передано воркерам (или получателей нет) - отчет пришлют они
+                await self.db.finish_scheduled(item.id)
+                return
+
+            # Между проверкой и регистрацией рассылки в active_broadcasts нет await
+            result = await run_broadcast_job(self._bot, self.db, job, rate_limit=rate_limit)
+            await self.db.finish_scheduled(item.id, "cancelled" if result.cancelled else "done")
+            await report_job(self._bot, self.db, job.id, f"✅ Запланированная рассылка #{job.id} завершена!")
+        except Exception as e:
+            logger.error(f"Ошибка запланированной рассылки {item.id}: {e}")
+
+    async def _drip_rate(self, item: ScheduledBroadcast, job_id: int) -> Optional[float]:
+        """Темп, при котором оставшиеся получатели равномерно распределяются до конца окна"""
+        if not item.spread_seconds:
+            return None
+
+        pending = (await self.db.get_job_counts(job_id)).get("pending", 0)
+        time_left = item.run_at.timestamp() + item.spread_seconds - time.time()
+        if not pending or time_left < 1:
+            # Окно уже прошло (например, бот был выключен) - досылаем с обычной скоростью
+            return None
+
+        rate = pending / time_left
+        logger.info(f"Рассылка {job_id}: {pending} получателей за {time_left / 3600:.1f} ч ({rate:.3f} сообщ./с)")
+        return rate
@@ -0,0 +1,111 @@
+import re
+from typing import List, Optional, Sequence, Tuple
+
+from aiogram.types import MessageEntity
+
+# Переменные шаблона - колонки пользователя, которые читаются вместе с получателями
+TEMPLATE_FIELDS = ("id", "first_name", "username")
+
+TOKEN_PATTERN = re.compile(r"\{\{|\}\}|\{(\w+)\}")
+
+
+def utf16_len(text: str) -> int:
+    """Длина в единицах UTF-16, в которых Telegram считает смещения сущностей"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+class MessageTemplate:
+    """Разобранный шаблон: готовые куски текста и места подстановки
+
+    Подстановка - это склейка списка строк и пересчет смещений сущностей
+    форматирования на разницу длин, без повторного разбора текста.
+    """
+
+    def __init__(self, parts: List[str], slots: List[Tuple[int, int]], fields: List[str],
+                 edits: List[Tuple[int, int, Optional[int]]], entities: List[dict]):
+        self.parts = parts
+        # (индекс куска, индекс значения) для каждой подстановки
+        self.slots = slots
+        self.fields = fields
+        self._entities = [
+            (MessageEntity(**entity), self._shift(edits, entity["offset"]),
+             self._shift(edits, entity["offset"] + entity["length"]))
+            for entity in entities
+        ]
+
+    @staticmethod
+    def _shift(edits: List[Tuple[int, int, Optional[int]]], position: int) -> Tuple[int, List[int]]:
+        """Постоянная часть сдвига позиции и значения, длина которых к ней прибавляется"""
+        constant, values = 0, []
+        for end, removed, value_index in edits:
+            if end > position:
+                break
+            if value_index is None:
+                # {{ или }} превращается в один символ
+                constant -= 1
+            else:
+                constant -= removed
+                values.append(value_index)
+        return constant, values
+
+    def render(self, values: Sequence) -> Tuple[str, Optional[List[MessageEntity]]]:
+        """Текст и сущности для одного получателя; values - значения в порядке fields"""
+        parts = self.parts.copy()
+        strings = ["" if value is None else str(value) for value in values]
+        for part_index, value_index in self.slots:
+            parts[part_index] = strings[value_index]
+
+        if not self._entities:
+            return "".join(parts), None
+
+        lengths = [utf16_len(string) for string in strings]
+        entities = []
+        for entity, (start_shift, start_values), (end_shift, end_values) in self._entities:
+            start = entity.offset + start_shift + sum(lengths[i] for i in start_values)
+            end = entity.offset + entity.length + end_shift + sum(lengths[i] for i in end_values)
+            if end > start:
+                # Копия без повторной проверки полей
+                entities.append(entity.model_copy(update={"offset": start, "length": end - start}))
+        return "".join(parts), entities or None
+
+
+def compile_template(text: str, entities: Optional[List[dict]] = None) -> Optional[MessageTemplate]:
+    """Разбор и проверка шаблона; None, если в тексте нет переменных и экранирования
+
+    Переменные записываются как {first_name}, фигурные скобки экранируются удвоением.
+    Неизвестная переменная - ValueError с ее именем.
+    """
+    parts: List[str] = []
+    slots: List[Tuple[int, int]] = []
+    fields: List[str] = []
+    # (конец в UTF-16, длина заменяемого текста, индекс значения) по порядку в тексте
+    edits: List[Tuple[int, int, Optional[int]]] = []
+
+    position = 0
+    utf16_position = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        literal = text[position:match.start()]
+        utf16_position += utf16_len(literal)
+        token = match.group(0)
+        utf16_position += len(token)
+        name = match.group(1)
+
+        if name is None:
+            parts.append(literal + token[0])
+            edits.append((utf16_position, 2, None))
+        else:
+            if name not in TEMPLATE_FIELDS:
+                raise ValueError(name)
+            if name not in fields:
+                fields.append(name)
+            parts.append(literal)
+            slots.append((len(parts), fields.index(name)))
+            parts.append("")
+            edits.append((utf16_position, len(token), fields.index(name)))
+        position = match.end()
+
+    if not edits:
+        return None
+
+    parts.append(text[position:])
+    return MessageTemplate(parts, slots, fields, edits, entities or [])
@@ -0,0 +1,125 @@
+import asyncio
+import hmac
+import logging
+import signal
+from typing import List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Прием обновлений по webhook: ограниченная очередь и пул обработчиков"""
+
+    def __init__(self, bot: Bot, dp: Dispatcher, path: str, secret: str, queue_size: int, workers: int):
+        self.bot = bot
+        self.dp = dp
+        self.path = path
+        self.secret = secret
+        self.workers = max(1, workers)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks: List[asyncio.Task] = []
+        self._runner: Optional[web.AppRunner] = None
+        self._site: Optional[web.TCPSite] = None
+        self._closing = False
+
+    async def start(self, host: str, port: int):
+        """Запуск HTTP-сервера и обработчиков очереди"""
+        app = web.Application()
+        app.router.add_post(self.path, self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        self._site = web.TCPSite(self._runner, host, port)
+        await self._site.start()
+
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Webhook-сервер слушает {host}:{port}{self.path}")
+
+    async def stop(self, drain_timeout: float):
+        """Остановка приема и обработка уже принятых обновлений"""
+        self._closing = True
+        if self._site is not None:
+            await self._site.stop()
+
+        try:
+            await asyncio.wait_for(self._queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не обработано обновлений при остановке: {self._queue.qsize()}")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._runner is not None:
+            await self._runner.cleanup()
+        logger.info("Webhook-сервер остановлен")
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if self.secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        if self._closing:
+            return web.Response(status=503)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning(f"Некорректное обновление: {e}")
+            return web.Response(status=400)
+
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram повторит доставку позже
+            return web.Response(status=503)
+        return web.Response()
+
+    async def _worker(self):
+        while True:
+            update = await self._queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                logger.error(f"Ошибка обработки обновления {update.update_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """Работа бота в режиме webhook до сигнала остановки"""
+    server = WebhookServer(
+        bot, dp,
+        path=settings.WEBHOOK_PATH,
+        secret=settings.WEBHOOK_SECRET,
+        queue_size=settings.WEBHOOK_QUEUE_SIZE,
+        workers=settings.WEBHOOK_WORKERS
+    )
+    await server.start(settings.WEBHOOK_HOST, settings.WEBHOOK_PORT)
+
+    # Без внешнего адреса сервер работает локально: обновления можно отправлять POST-запросами
+    if settings.WEBHOOK_URL:
+        await bot.set_webhook(
+            settings.WEBHOOK_URL.rstrip("/") + settings.WEBHOOK_PATH,
+            secret_token=settings.WEBHOOK_SECRET or None,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    try:
+        await stop.wait()
+    finally:
+        await server.stop(settings.WEBHOOK_DRAIN_TIMEOUT)
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
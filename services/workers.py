@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import os
+import socket
+
+from aiogram import Bot
+
+from config.settings import settings
+from database.database import Database
+from database.models import BroadcastShard
+from services.broadcast import report_job, send_job
+
+logger = logging.getLogger(__name__)
+
+
+async def _keep_alive(db: Database, shard: BroadcastShard, worker: str, send: asyncio.Task):
+    """Периодическое продление захвата диапазона; при потере захвата отправка останавливается"""
+    while True:
+        await asyncio.sleep(settings.WORKER_HEARTBEAT)
+        if not await db.heartbeat_shard(shard, worker):
+            logger.warning(f"Диапазон {shard.job_id}/{shard.shard} перехвачен другим воркером, отправка остановлена")
+            send.cancel()
+            return
+
+
+async def run_shard(bot: Bot, db: Database, shard: BroadcastShard, worker: str):
+    """Отправка одного диапазона получателей"""
+    job = await db.get_job(shard.job_id)
+    logger.info(f"Воркер {worker}: рассылка {shard.job_id}, диапазон {shard.shard} "
+                f"(id {shard.start_id}..{shard.end_id})")
+
+    send = asyncio.create_task(send_job(
+        bot, db, job,
+        after_id=shard.start_id - 1,
+        until_id=shard.end_id,
+        share=max(1, settings.BROADCAST_WORKERS)
+    ))
+    keep_alive = asyncio.create_task(_keep_alive(db, shard, worker, send))
+    try:
+        await send
+    except asyncio.CancelledError:
+        if not keep_alive.done():
+            raise
+        # Захват потерян - диапазон досылает воркер, который его забрал
+        return
+    finally:
+        keep_alive.cancel()
+
+    if await db.finish_shard(shard):
+        await report_job(bot, db, job.id, f"✅ Рассылка #{job.id} завершена!")
+
+
+async def run_worker(name: str):
+    """Цикл воркера: захват свободных диапазонов из общей таблицы и их отправка"""
+    worker = f"{socket.gethostname()}:{os.getpid()}:{name}"
+    bot = Bot(token=settings.BOT_TOKEN)
+    db = Database(
+        settings.DATABASE_URL,
+        read_pool_size=settings.DB_READ_POOL_SIZE,
+        write_batch_size=settings.DB_WRITE_BATCH_SIZE,
+        write_interval=settings.DB_WRITE_INTERVAL_MS / 1000,
+        cache_ttl=settings.CACHE_TTL
+    )
+    await db.init_db()
+    logger.info(f"Воркер {worker} запущен")
+
+    try:
+        while True:
+            shard = await db.claim_shard(worker, stale_after=settings.WORKER_HEARTBEAT * 3)
+            if shard is None:
+                await asyncio.sleep(settings.WORKER_POLL_INTERVAL)
+                continue
+            try:
+                await run_shard(bot, db, shard, worker)
+            except Exception as e:
+                # Захват диапазона устареет, и его заберет этот или другой воркер
+                logger.error(f"Воркер {worker}: ошибка в диапазоне {shard.job_id}/{shard.shard}: {e}")
+                await asyncio.sleep(settings.WORKER_POLL_INTERVAL)
+    finally:
+        await db.close()
+        await bot.session.close()
@@ -2,6 +2,8 @@ from aiogram.fsm.state import State, StatesGroup
 
 class AdminStates(StatesGroup):
     waiting_for_user_input = State()
+    waiting_for_import_file = State()
+    waiting_for_tag_input = State()
     waiting_for_message = State()
-    waiting_for_user_delete = State()
-    confirming_broadcast = State()
\ No newline at end of file
+    confirming_broadcast = State()
+    waiting_for_schedule = State()
\ No newline at end of file
@@ -0,0 +1,96 @@
+import asyncio
+import sqlite3
+from datetime import datetime
+
+from database.database import Database
+from database.migrations import MIGRATIONS
+
+# Схема до появления миграций: даты строками ISO, без PRAGMA user_version
+BASELINE_SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY,
+    username TEXT,
+    first_name TEXT NOT NULL,
+    added_date TEXT NOT NULL,
+    is_active INTEGER DEFAULT 1
+);
+CREATE TABLE messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    text TEXT NOT NULL,
+    created_date TEXT NOT NULL,
+    is_active INTEGER DEFAULT 1
+);
+"""
+
+USERS = [
+    (1, "Ann", "Аня", "2023-05-01T10:00:00.123456", 1),
+    (2, "ann", "Анна", "2024-01-02T03:04:05", 1),
+    (3, None, "Боб", "2024-02-03T04:05:06", 0),
+]
+
+
+def create_baseline(path: str):
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany("INSERT INTO users VALUES (?, ?, ?, ?, ?)", USERS)
+    conn.execute("INSERT INTO messages (text, created_date, is_active) VALUES ('Привет', '2024-03-04T05:06:07', 1)")
+    conn.commit()
+    conn.close()
+
+
+async def init_and_read(path: str, processes: int = 1):
+    databases = [Database(path) for _ in range(processes)]
+    try:
+        await asyncio.gather(*(db.init_db() for db in databases))
+        return await databases[0].get_users(active_only=False), await databases[0].get_active_message()
+    finally:
+        for db in databases:
+            await db.close()
+
+
+def user_version(path: str) -> int:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_baseline_database_is_migrated_in_place(tmp_path):
+    path = str(tmp_path / "bot.db")
+    create_baseline(path)
+
+    users, message = asyncio.run(init_and_read(path))
+
+    assert user_version(path) == len(MIGRATIONS)
+    by_id = {user.id: user for user in users}
+    assert by_id[1].added_date == datetime(2023, 5, 1, 10, 0)
+    assert by_id[2].added_date == datetime(2024, 1, 2, 3, 4, 5)
+    # Из дублей username без учета регистра остается у последнего добавленного
+    assert (by_id[1].username, by_id[2].username) == (None, "ann")
+    assert not by_id[3].is_active
+    assert message.text == "Привет"
+    assert message.created_date == datetime(2024, 3, 4, 5, 6, 7)
+
+
+def test_concurrent_startup_applies_each_migration_once(tmp_path):
+    path = str(tmp_path / "bot.db")
+    create_baseline(path)
+
+    users, _ = asyncio.run(init_and_read(path, processes=4))
+
+    assert user_version(path) == len(MIGRATIONS)
+    assert sorted(user.added_date for user in users) == [
+        datetime(2023, 5, 1, 10, 0), datetime(2024, 1, 2, 3, 4, 5), datetime(2024, 2, 3, 4, 5, 6)
+    ]
+
+
+def test_migrated_database_is_not_migrated_again(tmp_path):
+    path = str(tmp_path / "bot.db")
+    create_baseline(path)
+    asyncio.run(init_and_read(path))
+
+    users, _ = asyncio.run(init_and_read(path))
+
+    assert user_version(path) == len(MIGRATIONS)
+    assert {user.id: user.added_date for user in users}[2] == datetime(2024, 1, 2, 3, 4, 5)
@@ -0,0 +1,83 @@
+import pytest
+
+from services.templates import compile_template, utf16_len
+
+
+def entity(text: str, part: str, entity_type: str = "bold") -> dict:
+    """Сущность на первое вхождение part в тексте шаблона, смещения в UTF-16"""
+    start = text.index(part)
+    return {"type": entity_type, "offset": utf16_len(text[:start]), "length": utf16_len(part)}
+
+
+def covered(text: str, message_entity) -> str:
+    """Текст под сущностью с учетом смещений в UTF-16"""
+    data = text.encode("utf-16-le")
+    start = message_entity.offset * 2
+    return data[start:start + message_entity.length * 2].decode("utf-16-le")
+
+
+def test_plain_text_is_not_a_template():
+    assert compile_template("Привет всем! 😀") is None
+
+
+def test_unknown_field_raises_with_its_name():
+    with pytest.raises(ValueError, match="last_name"):
+        compile_template("Привет, {last_name}")
+
+
+def test_escaped_braces():
+    template = compile_template("{{first_name}} = {first_name}, {{}}")
+
+    text, entities = template.render(["Аня"])
+
+    assert text == "{first_name} = Аня, {}"
+    assert entities is None
+
+
+def test_fields_are_listed_once_in_order_of_appearance():
+    template = compile_template("{username} {first_name} {username}")
+
+    assert template.fields == ["username", "first_name"]
+    assert template.render(["ann", "Аня"])[0] == "ann Аня ann"
+
+
+def test_none_value_renders_as_empty_string():
+    template = compile_template("@{username}!")
+
+    assert template.render([None])[0] == "@!"
+
+
+@pytest.mark.parametrize("value", ["Аня", "𝒜😀", "", "👨‍👩‍👧 Семья"])
+def test_entities_around_and_after_placeholders_with_astral_characters(value):
+    source = "😀 Привет, {first_name}! Жирный 𝕏 текст {{ок}} и ссылка"
+    parts = ["😀", "Привет, {first_name}!", "Жирный 𝕏 текст", "{{ок}}", "ссылка"]
+    template = compile_template(source, [entity(source, part) for part in parts])
+
+    text, entities = template.render([value])
+
+    assert text == f"😀 Привет, {value}! Жирный 𝕏 текст {{ок}} и ссылка"
+    assert [covered(text, item) for item in entities] == [
+        "😀", f"Привет, {value}!", "Жирный 𝕏 текст", "{ок}", "ссылка"
+    ]
+
+
+def test_entity_inside_placeholder_only_is_dropped_for_empty_value():
+    source = "Привет, {first_name}!"
+    template = compile_template(source, [entity(source, "{first_name}", "italic"), entity(source, "!")])
+
+    text, entities = template.render([""])
+
+    assert text == "Привет, !"
+    assert [(item.type, covered(text, item)) for item in entities] == [("bold", "!")]
+
+
+def test_render_does_not_mutate_template_between_recipients():
+    source = "{first_name}: 𝒜"
+    template = compile_template(source, [entity(source, "𝒜")])
+
+    first = template.render(["😀😀"])
+    second = template.render(["a"])
+
+    assert covered(first[0], first[1][0]) == "𝒜"
+    assert covered(second[0], second[1][0]) == "𝒜"
+    assert template.render(["😀😀"]) == first
@@ -0,0 +1,43 @@
+import asyncio
+import logging
+import multiprocessing
+
+from config.settings import settings
+from services.workers import run_worker
+
+logger = logging.getLogger(__name__)
+
+
+def worker_process(name: str):
+    """Точка входа отдельного процесса-воркера"""
+    logging.basicConfig(
+        level=getattr(logging, settings.LOG_LEVEL),
+        format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    try:
+        asyncio.run(run_worker(name))
+    except KeyboardInterrupt:
+        logger.info(f"Воркер {name} остановлен")
+
+
+def main():
+    """Запуск процессов-воркеров рассылки"""
+    count = max(1, settings.BROADCAST_WORKERS)
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=worker_process, args=(f"worker-{i}",), name=f"worker-{i}")
+        for i in range(count)
+    ]
+
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()